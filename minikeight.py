@@ -4,22 +4,93 @@
 ## Router classes for example
 ##
 
-import sys, re, json
+import sys, os, io, re, json, time, heapq, pickle, copyreg, hashlib, marshal, mmap, struct
+import _sre
 from os.path import splitext
+from collections import OrderedDict, namedtuple
+from array import array
 from datetime import date
 from wsgiref.util import setup_testing_defaults
+try:
+    import numpy as np     # optional (used only by BatchClassifier)
+except ImportError:
+    np = None
 
 PY3 = sys.version_info[0] == 3
 if not PY3:
     raise Exception("supports only Python3.")
 
 
+def _split_suffix(path):
+    ## faster than 'os.path.splitext()' (ex: '/books/1.json' -> ('/books/1', '.json'))
+    dot = path.rfind('.')
+    if dot < 0:
+        return path, ""
+    slash = path.rfind('/')
+    if dot < slash:
+        return path, ""
+    if dot > slash + 1 and path[slash+1] != '.':
+        return path[:dot], path[dot:]
+    return splitext(path)   # ex: '/.json' or '/..json' (leading dots are not suffix)
+
+
+class _NoParams(list):
+    """empty list which is not modifiable. it is shared by static routes
+    as 'param_args', because 'find()' returns their entries as is."""
+    __slots__ = ()
+
+    def _not_modifiable(self, *args, **kwargs):
+        raise TypeError("params of static route are not modifiable.")
+
+    append = extend = insert = remove = pop = clear = sort = reverse = _not_modifiable
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _not_modifiable
+
+_NO_PARAMS = _NoParams()
+
+
 class RouterError(Exception):
     pass
 
 
+class SegmentClassifier(object):
+    """Classifies urlpath segment into int, str or empty without raising
+    exception, and caches int values of hot segments (such as '123' or 'v1').
+    Custom param types can reuse it (ex: 'Router.SEGMENT_CLASSIFIER.int_value(s)')."""
+
+    EMPTY, INT, STR = 0, 1, 2
+
+    def __init__(self, cache_size=4096):
+        self.cache_size = cache_size
+        self.int_values = {}      # {segment: int value, or -1 if not int}
+
+    def int_value(self, segment):
+        """returns int value of segment, or -1 if it is not non-negative integer."""
+        val = self.int_values.get(segment)
+        if val is None:
+            ## 'isdecimal()' avoids ValueError, which is expensive on slug
+            val = -1
+            if segment.isdecimal():
+                try:
+                    val = int(segment)
+                except ValueError:   # too many digits (see 'sys.get_int_max_str_digits()')
+                    pass
+            cache = self.int_values
+            if len(cache) >= self.cache_size:
+                cache.clear()     # simple, and hot segments come back soon
+            cache[segment] = val
+        return val
+
+    def classify(self, segment):
+        """returns EMPTY, INT or STR."""
+        if not segment:
+            return self.EMPTY
+        return self.INT if self.int_value(segment) >= 0 else self.STR
+
+
 class Router(object):
 
+    SEGMENT_CLASSIFIER = SegmentClassifier()   # shared by all router classes
+
     def find(self, req_path):
         raise NotImplementedError("%s.find(): not implemented yet." % self.__class__.__name__)
 
@@ -28,17 +99,153 @@ class Router(object):
         if t is None:
             return None, None, None
         handler_class, handler_methods, param_args = t
-        fn = handler_methods.get
-        handler_func = fn(req_meth) or (req_meth == 'HEAD' and fn('GET')) or fn('ANY')
+        try:
+            handler_func = handler_methods.dispatch[req_meth]
+        except AttributeError:   # not a HandlerMethods object
+            handler_func = HandlerMethods(handler_methods).dispatch[req_meth]
         return handler_class, handler_func, param_args  # handler_func may be None
 
+    _static_matches = None   # {urlpath: RouteMatch} (built by 'match()')
+
+    def match(self, req_path):
+        """returns RouteMatch object (or None if not found).
+        Static urlpath returns preallocated object instead of creating new one,
+        and dynamic urlpath is resolved by '_match_dynamic()'."""
+        static_matches = self._static_matches
+        if static_matches is None:
+            static_matches = self._static_matches = {
+                path: RouteMatch(hm.route[0], path, hc, hm, (), ())
+                    for path, (hc, hm, _) in getattr(self, '_mapping_dict', {}).items()
+                        if getattr(hm, 'route', None) is not None
+            }
+        m = static_matches.get(req_path)
+        if m is not None:
+            return m
+        m = self._match_dynamic(req_path)
+        if m is not None and m.pattern == req_path:   # static route which is not in '_mapping_dict'
+            static_matches[req_path] = m
+        return m
+
+    def _match_dynamic(self, req_path):
+        ## creates RouteMatch from params list of 'find()';
+        ## subclass can override to build params tuple directly.
+        t = self.find(req_path)
+        if t is None:
+            return None
+        handler_class, handler_methods, param_args = t
+        route = getattr(handler_methods, 'route', None) or (None, None, ())
+        route_id, path_pat, param_names = route
+        return RouteMatch(route_id, path_pat, handler_class, handler_methods,
+                          param_names, tuple(param_args))
+
+    def allowed_methods(self, req_path):
+        t = self.find(req_path)
+        if t is None:
+            return None
+        handler_methods = t[1]
+        if not isinstance(handler_methods, HandlerMethods):
+            handler_methods = HandlerMethods(handler_methods)
+        return handler_methods.allowed  # ex: frozenset({'GET', 'HEAD', 'POST'})
+
+    _redirects = None   # static urlpaths (built by 'build_redirects()')
+
+    def build_redirects(self, mapping):
+        """builds table to find redirect location without second 'find()'.
+        ('mapping' should be the same as that of router.)"""
+        statics = set()
+        dynamics = set()
+        for path_pat, _, _ in Router()._traverse(mapping):
+            (dynamics if '{' in path_pat else statics).add(path_pat)
+        ## matches to any dynamic route; prefixes are factored out like
+        ## OptimizedRegexpRouter, because flat alternation is too slow
+        ## (ex: '^/api/(?:books/[^/]+($)|users/[^/]+(?:($)|/edit($)))$')
+        builder = _RedirectRegexpBuilder()
+        tree = builder._build_tree([ (p, None, None) for p in sorted(dynamics) ])
+        self._redirects = frozenset(statics)
+        self._redirect_rexp = builder._build_rexp(tree) if tree else None
+        return self
+
+    def find_redirect(self, req_path):
+        """returns urlpath which has trailing '/' added or removed if it
+        is found, else returns None."""
+        location = req_path[:-1] if req_path.endswith('/') else req_path+'/'
+        if self._redirects is None:    # table is not built
+            return location if self.find(location) is not None else None
+        if location in self._redirects:
+            return location
+        rexp = self._redirect_rexp
+        if rexp is not None and rexp.match(location):
+            return location
+        return None
+
+    def _clear_caches(self):
+        ## called by 'add_route()' and 'remove_route()', because tables built
+        ## by 'match()' and 'build_redirects()' don't know the updated route
+        ## (redirect location is found by 'find()' after that)
+        self._static_matches = None
+        self._redirects = None
+
+    def find_many(self, req_paths):
+        """returns list of 'find()' results for each request path.
+        same urlpaths are resolved only once, and the rest are resolved
+        in group by '_find_each()' (which subclass can optimize)."""
+        req_paths = list(req_paths)
+        unique = list(dict.fromkeys(req_paths))
+        if len(unique) == len(req_paths):
+            return self._find_each(req_paths)
+        results = dict(zip(unique, self._find_each(unique)))
+        ## duplicated urlpaths should not share the same param args list
+        tuples = []
+        seen = set()
+        for req_path in req_paths:
+            tupl = results[req_path]
+            if tupl is not None and tupl[2]:
+                if req_path in seen:
+                    tupl = (tupl[0], tupl[1], list(tupl[2]))
+                else:
+                    seen.add(req_path)
+            tuples.append(tupl)
+        return tuples
+
+    def _find_each(self, req_paths):
+        ## resolves unique urlpaths. subclass can override this
+        ## to share works between urlpaths.
+        find = self.find
+        return [ find(p) for p in req_paths ]
+
+    def lookup_many(self, req_meths, req_paths):
+        """returns list of 'lookup()' results for each request path.
+        'req_meths' is a request method (ex: 'GET') or a list of them."""
+        req_paths = list(req_paths)
+        if isinstance(req_meths, str):
+            req_meths = [req_meths] * len(req_paths)
+        results = []
+        for req_meth, t in zip(req_meths, self.find_many(req_paths)):
+            if t is None:
+                results.append((None, None, None))
+                continue
+            handler_class, handler_methods, param_args = t
+            try:
+                handler_func = handler_methods.dispatch[req_meth]
+            except AttributeError:   # not a HandlerMethods object
+                handler_func = HandlerMethods(handler_methods).dispatch[req_meth]
+            results.append((handler_class, handler_func, param_args))
+        return results
+
     def _each_keyval(self, obj):
         if isinstance(obj, dict):
             return obj.items()
         else:
             return obj
 
+    _route_table = None   # RouteTable object (when passed instead of mapping)
+
     def _traverse(self, mapping, base_path="", mapping_class=None):
+        if isinstance(mapping, RouteTable):   # already traversed and validated
+            self._route_table = mapping
+            self._route_count = mapping.route_count
+            yield from mapping.routes
+            return
         if mapping_class is None:
             mapping_class = type(mapping)
         for sub_path, arg in self._each_keyval(mapping):
@@ -50,8 +257,22 @@ class Router(object):
                 self._validate(handler_class)
                 for path, handler_methods in handler_class.__mapping__:
                     full_path_pat = base_path+sub_path+path
+                    handler_methods = self._method_table(handler_methods, full_path_pat)
                     yield full_path_pat, handler_class, handler_methods
 
+    _route_count = 0    # number of routes registered (used as route id)
+
+    def _method_table(self, handler_methods, path_pat):
+        ## creates new object for each route, because it carries route info
+        handler_methods = HandlerMethods(handler_methods)
+        route_id = self._route_count
+        self._route_count = route_id + 1
+        param_names = tuple(self._param_name_rexp.findall(path_pat))
+        handler_methods.route = (route_id, path_pat, param_names)
+        return handler_methods
+
+    _param_name_rexp = re.compile(r'\{(\w+)')
+
     def _validate(self, handler_class):
         cls = handler_class
         if type(cls) is not type:
@@ -62,6 +283,16 @@ class Router(object):
             raise RouterError("%s: no handler funcs defined." % (cls,))
 
     def _scan(self, urlpath_pattern):
+        table = self._route_table
+        if table is None or table.param_types is not self.URLPATH_PARAM_TYPES:
+            return self._scan_pattern(urlpath_pattern)
+        tupls = table._scans.get(urlpath_pattern)
+        if tupls is None:
+            tupls = tuple(self._scan_pattern(urlpath_pattern))
+            table._scans[urlpath_pattern] = tupls
+        return tupls
+
+    def _scan_pattern(self, urlpath_pattern):
         m1 = None
         for m1 in re.finditer(r'(.*?)\{([^}]*)\}', urlpath_pattern):
             text, placeholder = m1.groups()
@@ -90,6 +321,18 @@ class Router(object):
         return 'str'
 
     def _compile(self, urlpath_pattern, begin='^', end='$', grouping=True):
+        table = self._route_table
+        if table is None or table.param_types is not self.URLPATH_PARAM_TYPES:
+            return self._compile_pattern(urlpath_pattern, begin, end, grouping)
+        key = (urlpath_pattern, begin, end, grouping)
+        tupl = table._compiles.get(key)
+        if tupl is None:
+            tupl = self._compile_pattern(urlpath_pattern, begin, end, grouping)
+            table._compiles[key] = tupl
+        path_rexp, param_names, param_funcs = tupl
+        return path_rexp, list(param_names), list(param_funcs)
+
+    def _compile_pattern(self, urlpath_pattern, begin, end, grouping):
         if urlpath_pattern.endswith('.*'):
             end = r'(?:\.\w+)?' + end
             urlpath_pattern = urlpath_pattern[:-2]
@@ -113,27 +356,412 @@ class Router(object):
         arr.append(end)
         return re.compile("".join(arr)), param_names, param_funcs
 
-    def _is_valid_suffix(self, actual_suffix, expected_suffix):
-        if actual_suffix == expected_suffix:
-            return True
-        if expected_suffix == '.*':
-            return True
+    ## backtracking of trie-base routers
+
+    def _edges_overlap(self, children):
+        ## returns True if a segment can be accepted by two or more edges
+        ## ('children' is a dict of trie node or state machine).
+        statics = [ k for k in children if isinstance(k, str) ]
+        n = (1 in children) + (2 in children) + len(children.get(4, ()))
+        if 3 in children:     # 3: path (accepts any segment)
+            return n + len(statics) > 0
+        if 2 in children:     # 2: str (accepts any non-empty segment)
+            return n > 1 or any(statics)
+        if 4 in children:     # 4: custom types (may accept static segment)
+            return n > 1 or bool(statics)
+        if 1 in children:     # 1: int
+            int_value = self.SEGMENT_CLASSIFIER.int_value
+            return any( int_value(k) >= 0 for k in statics )
         return False
 
+    def _accepting_edges(self, children, item):
+        ## yields '(child, param_args)' of edges which accept segment
+        ## (except 'path' type), in the same order as greedy lookup.
+        child = children.get(item)
+        if child is not None:
+            yield child, []
+        child = children.get(1)        # 1: int
+        if child is not None:
+            intval = self.SEGMENT_CLASSIFIER.int_value(item)
+            if intval >= 0:
+                yield child, [intval]
+        for _, parser, child in children.get(4, ()):   # 4: custom types
+            val = parser(item)
+            if val is not None:
+                yield child, [val]
+        child = children.get(2)        # 2: str
+        if child is not None and item:
+            yield child, [item]
+
+    def _accept(self, targets, suffix, param_args):
+        ## 'targets' is a dict of suffix and target (ex: {'.json': t1, '.*': t2})
+        if targets is None:
+            return None
+        t = targets.get(suffix) or targets.get('.*')
+        if t is None:
+            return None
+        return t[0], t[1], param_args
+
+    def _suffix_index(self, targets_list, has_path_param):
+        ## returns suffixes which any route accepts, or None when all
+        ## suffixes can be accepted (by '.*' or 'path' param).
+        if has_path_param:
+            return None
+        suffixes = set()
+        for targets in targets_list:
+            suffixes.update(targets)
+        if '.*' in suffixes:
+            return None
+        return frozenset(suffixes)
+
+    def _slice(self, urlpath_pattern):
+        """returns '(slice, sep, has_suffix)', where 'sep' is None (one param),
+        a string (same separator between all params), or a tuple of separators.
+        returns '(None, None, has_suffix)' when params can't be sliced."""
+        table = self._route_table
+        if table is None or table.param_types is not self.URLPATH_PARAM_TYPES:
+            return self._slice_pattern(urlpath_pattern)
+        tupl = table._slices.get(urlpath_pattern)
+        if tupl is None:
+            tupl = table._slices[urlpath_pattern] = self._slice_pattern(urlpath_pattern)
+        return tupl
+
+    def _slice_pattern(self, urlpath_pattern):
+        has_suffix = urlpath_pattern.endswith('.*')
+        if has_suffix:
+            urlpath_pattern = urlpath_pattern[:-2]  # ex: '/{id}.*' => '/{id}'
+        texts  = []    # ex: '/books/{id}/comments/{code}.json' => ['/books/', '/comments/', '.json']
+        ptypes = []    # ex: '/books/{id}/comments/{code}.json' => ['int', 'str']
+        for text, pname, ptype, _, _ in self._scan(urlpath_pattern):
+            texts.append(text)
+            if pname:
+                ptypes.append(ptype)
+        if len(texts) == len(ptypes):
+            texts.append("")                        # no text after the last param
+        head, seps, tail = texts[0], texts[1:-1], texts[-1]
+        ## each param should be followed by separator starting with a char
+        ## which the param never contains, otherwise it can't be splitted.
+        for ptype, sep in zip(ptypes, seps):
+            if not sep:
+                return None, None, has_suffix
+            if ptype == 'int' and not sep[0].isdigit():
+                continue
+            if ptype == 'str' and sep[0] in './':
+                continue
+            return None, None, has_suffix
+        ## 'path' or custom type param may contain '.' at the end
+        if has_suffix and (ptypes[-1] not in ('int', 'str') or '.' in tail):
+            return None, None, has_suffix
+        slice_ = slice(len(head), - len(tail) or None)
+        if not seps:
+            return slice_, None, has_suffix
+        if len(set(seps)) == 1:
+            return slice_, seps[0], has_suffix
+        return slice_, tuple(seps), has_suffix
+
+    def _slice_params(self, req_path, slice_, sep, has_suffix, param_funcs):
+        if has_suffix:
+            req_path = _split_suffix(req_path)[0]    # ex: "/123.json" -> "/123"
+        s = req_path[slice_]                         # ex: "/books/123/comments/456.json" -> "123/comments/456"
+        if sep is None:
+            values = [s]
+        elif sep.__class__ is str:
+            values = s.split(sep, len(param_funcs) - 1)
+        else:
+            values = []
+            for sep_ in sep:                         # ex: ("/pulls/", "/reviews/")
+                value, s = s.split(sep_, 1)
+                values.append(value)
+            values.append(s)
+        return [ (fn(v) if fn else v) for v, fn in zip(values, param_funcs) ]
+
     URLPATH_PARAM_TYPES = {
         'int'  : (r'\d+'   , int),
         'str'  : (r'[^./]+', None),
         'path' : (r'.*'    , None),
     }
+    URLPATH_PARAM_PARSERS = {}   # for custom param types (used by trie routers)
+
+    @classmethod
+    def register_param_type(cls, name, rexp, func=None, parser=None):
+        """Registers custom param type such as 'uuid' or 'date'.
+        'rexp' is used by regexp routers and should not match to '/'.
+        'parser' is used by trie routers; it takes a path segment and
+        returns converted value, or None when segment is invalid.
+        When 'parser' is not specified, it is built from 'rexp' and 'func'.
+        """
+        if name in ('int', 'str', 'path'):
+            raise RouterError("%s: cannot redefine builtin param type." % name)
+        if not re.match(r'^\w+$', name):
+            raise RouterError("%r: invalid param type name." % (name,))
+        if re.compile(rexp).groups:
+            raise RouterError("%s: capturing group is not allowed in param type regexp." % rexp)
+        if parser is None:
+            parser = _ParamParser(rexp, func)
+        ## copy-on-write not to affect parent class
+        if 'URLPATH_PARAM_TYPES' not in cls.__dict__:
+            cls.URLPATH_PARAM_TYPES = dict(cls.URLPATH_PARAM_TYPES)
+        if 'URLPATH_PARAM_PARSERS' not in cls.__dict__:
+            cls.URLPATH_PARAM_PARSERS = dict(cls.URLPATH_PARAM_PARSERS)
+        cls.URLPATH_PARAM_TYPES[name] = (rexp, func)
+        cls.URLPATH_PARAM_PARSERS[name] = parser
 
     def _escape(self, s, _fn=lambda m: '\\'+m.group(0)):
         return re.sub(r'[.*+?^$|\[\]{}()]', _fn, s)
 
+    ## adaptive ordering of linear routers (reorders routes by hit count)
+
+    def _enable_adaptive(self, interval, entry_lists):
+        self._adaptive_interval = interval
+        self._adaptive_countdown = interval
+        self._hit_counts = {}   # {id(handler_methods): count}
+        ## overlap graph is built here, because it is too heavy for request
+        self._overlaps = { k: self._overlap_graph(entries)    # {key: (entries, successors)}
+                               for k, entries in entry_lists.items() }
+        self.find = self._counting_find
+
+    def _counting_find(self, req_path):
+        t = self.__class__.find(self, req_path)
+        if t is not None:
+            k = id(t[1])
+            self._hit_counts[k] = self._hit_counts.get(k, 0) + 1
+            self._adaptive_countdown -= 1
+            if self._adaptive_countdown <= 0:
+                self._adaptive_countdown = self._adaptive_interval
+                self._reorder()
+                for k in self._hit_counts:     # decay old hits
+                    self._hit_counts[k] //= 2
+        return t
+
+    def _reorder(self):
+        raise NotImplementedError("%s._reorder(): not implemented yet." % self.__class__.__name__)
+
+    def _overlap_graph(self, entries):
+        """returns entries in declared order and successors of each entry
+        (ex: [[1, 2], [], []]; successors may match to the same urlpath)."""
+        entries = list(entries)
+        seg_rexps = {}   # {segment: compiled regexp}
+        buckets = {}     # {number of segments: [index, ...]}
+        succs = [ [] for _ in entries ]
+        anywhere = []    # indices of entries having 'path' param
+        for i, t in enumerate(entries):
+            if self._has_path_param(t[0]):
+                anywhere.append(i)
+            else:
+                buckets.setdefault(len(self._split_segments(t[0])), []).append(i)
+        for indices in buckets.values():   # params except 'path' never match to '/'
+            segs_list = [ self._split_segments(entries[i][0]) for i in indices ]
+            for a, i in enumerate(indices):
+                segs1 = segs_list[a]
+                for b in range(a+1, len(indices)):
+                    if self._segments_overlap(segs1, segs_list[b], seg_rexps):
+                        succs[i].append(indices[b])
+        anywhere_set = set(anywhere)
+        for i in anywhere:                 # overlaps with all entries
+            succs[i].extend(range(i+1, len(entries)))
+            for j in range(i):
+                if j not in anywhere_set:  # else already added
+                    succs[j].append(i)
+        return entries, succs
+
+    def _segments_overlap(self, segs1, segs2, seg_rexps):
+        for seg1, seg2 in zip(segs1, segs2):
+            if seg1 == seg2:
+                continue
+            static1 = '{' not in seg1 and not seg1.endswith('.*')
+            static2 = '{' not in seg2 and not seg2.endswith('.*')
+            if static1 and static2:
+                return False
+            if static1 or static2:
+                seg, pat = (seg1, seg2) if static1 else (seg2, seg1)
+                rexp = seg_rexps.get(pat)
+                if rexp is None:
+                    rexp = seg_rexps[pat] = self._compile(pat)[0]
+                if not rexp.match(seg):
+                    return False
+        return True
+
+    def _reorder_list(self, entries, graph, index):
+        """returns list sorted by hit count, keeping order of entries
+        which may match to the same urlpath (= first-match semantics)."""
+        declared, succs = graph
+        counts = self._hit_counts
+        rank = { id(t): i for i, t in enumerate(entries) }   # keeps current order if tie
+        ranks = [ rank[id(t)] for t in declared ]
+        indegree = [0] * len(declared)
+        for js in succs:
+            for j in js:
+                indegree[j] += 1
+        heap = [ (-counts.get(id(t[index]), 0), ranks[i], i)
+                     for i, t in enumerate(declared) if indegree[i] == 0 ]
+        heapq.heapify(heap)
+        new_list = []
+        while heap:
+            _, _, i = heapq.heappop(heap)
+            new_list.append(declared[i])
+            for j in succs[i]:
+                indegree[j] -= 1
+                if indegree[j] == 0:
+                    t2 = declared[j]
+                    heapq.heappush(heap, (-counts.get(id(t2[index]), 0), ranks[j], j))
+        assert len(new_list) == len(entries), "** internal error"
+        return new_list
+
+    def _has_path_param(self, urlpath_pattern):
+        return any( ptype == 'path' for _, _, ptype, _, _ in self._scan(urlpath_pattern) )
+
+    def _split_segments(self, urlpath_pattern):
+        ## ex: '/books/{id}.*' -> ['', 'books', '{id}.*']
+        return urlpath_pattern.split('/')
+
+    ## snapshot of built router (for fast startup of worker processes)
+
+    SNAPSHOT_VERSION = 5
+
+    def save_snapshot(self, filename, mapping):
+        """saves built tables into file; 'mapping' should be the same object
+        as passed to constructor (and is used only to calculate fingerprint)."""
+        buf = io.BytesIO()
+        pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+        pickler.dispatch_table = copyreg.dispatch_table.copy()
+        pickler.dispatch_table[re.Pattern] = _reduce_regexp
+        pickler.dump(self._snapshot_header(mapping))
+        pickler.dump(self._snapshot_state())
+        tmpfile = "%s.%s.tmp" % (filename, os.getpid())
+        with open(tmpfile, 'wb') as f:
+            f.write(buf.getvalue())
+        os.replace(tmpfile, filename)   # atomic, even if other workers are reading
+
+    @classmethod
+    def load_snapshot(cls, filename, mapping):
+        """returns router object restored from snapshot file, or None when
+        file not found, broken or stale (version, router class or mapping changed).
+        (don't load snapshot file from untrusted source, because it is pickle.)"""
+        router = cls.__new__(cls)
+        try:
+            with open(filename, 'rb') as f:
+                unpickler = pickle.Unpickler(f)
+                if unpickler.load() != router._snapshot_header(mapping):
+                    return None
+                state = unpickler.load()
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError,
+                IndexError, KeyError, AttributeError, ImportError):
+            return None    # truncated, corrupted or written in older format
+        router._restore_state(state)
+        return router
+
+    def _snapshot_header(self, mapping):
+        klass = self.__class__
+        classname = "%s.%s" % (klass.__module__, klass.__qualname__)
+        return (classname, self.SNAPSHOT_VERSION, sys.implementation.cache_tag,
+                _sre.MAGIC, self._fingerprint(mapping))
+
+    def _fingerprint(self, mapping):
+        ## handler classes and functions are saved as reference (qualified name)
+        sb = []
+        name = lambda x: "%s.%s" % (x.__module__, x.__qualname__)
+        for path_pat, handler_class, handler_methods in Router()._traverse(mapping):
+            funcs = ",".join( "%s=%s" % (k, name(v)) for k, v in sorted(handler_methods.items()) )
+            sb.append("%s\t%s\t%s\n" % (path_pat, name(handler_class), funcs))
+        return hashlib.sha1("".join(sb).encode('utf-8')).hexdigest()
+
+    def _snapshot_state(self):
+        return self.__dict__
+
+    def _restore_state(self, state):
+        self.__dict__.update(state)
+
+    def __getstate__(self):       # for nested router objects
+        return self._snapshot_state()
+
+    def __setstate__(self, state):
+        self._restore_state(state)
+
+
+## saves compiled regexp code instead of pattern string, because
+## parsing and compiling a huge regexp is the most expensive part.
+try:
+    from re import _parser as _sre_parse, _compiler as _sre_compile   # Python >= 3.11
+except ImportError:
+    import sre_parse as _sre_parse, sre_compile as _sre_compile
+
+def _reduce_regexp(rexp):
+    p = _sre_parse.parse(rexp.pattern, rexp.flags)
+    code = [ int(x) for x in _sre_compile._code(p, rexp.flags) ]
+    args = (rexp.pattern, rexp.flags, code, rexp.groups, dict(rexp.groupindex), _sre.MAGIC)
+    return _restore_regexp, args
+
+def _restore_regexp(pattern, flags, code, groups, groupindex, magic):
+    if magic != _sre.MAGIC:
+        return re.compile(pattern, flags)
+    indexgroup = [None] * (groups + 1)
+    for k, i in groupindex.items():
+        indexgroup[i] = k
+    return _sre.compile(pattern, flags, code, groups, groupindex, tuple(indexgroup))
+
+class RouteTable(object):
+    """Traversed and validated routes of mapping, which is built once and
+    shared by router objects instead of mapping (ex: 'TrieRouter(table)').
+    Parsed, sliced and compiled urlpath patterns are cached in it as well."""
+
+    def __init__(self, mapping):
+        builder = Router()
+        self.mapping = mapping
+        self.routes  = list(builder._traverse(mapping))  # [(path_pat, handler_class, handler_methods)]
+        self.route_count = builder._route_count
+        self.param_types = Router.URLPATH_PARAM_TYPES   # caches are valid only for them
+        self._scans    = {}   # {urlpath_pattern: tuple of '_scan()' results}
+        self._compiles = {}   # {(urlpath_pattern, begin, end, grouping): '_compile()' result}
+        self._slices   = {}   # {urlpath_pattern: '_slice()' result}
+
+    def __len__(self):
+        return len(self.routes)
+
+    def _subset(self, routes):
+        ## returns table which has part of routes, sharing caches with self
+        table = self.__class__.__new__(self.__class__)
+        table.__dict__.update(self.__dict__)
+        table.mapping = None
+        table.routes  = routes
+        return table
+
+    def __reduce__(self):
+        ## routes are saved into router snapshot (lazy router builds subrouter
+        ## from them after loaded), but caches are not
+        return _restore_route_table, (self.routes, self.route_count)
+
+def _restore_route_table(routes, route_count):
+    table = RouteTable([])
+    table.mapping = None
+    table.routes  = routes
+    table.route_count = route_count
+    return table
+
+
+class _ParamParser(object):
+    """Validates and converts path segment according to regexp"""
+    __slots__ = ('fullmatch', 'func')
+
+    def __init__(self, rexp, func=None):
+        self.fullmatch = re.compile(rexp).fullmatch
+        self.func = func
+
+    def __call__(self, segment):
+        if not self.fullmatch(segment):
+            return None
+        func = self.func
+        return func(segment) if func is not None else segment
+
+    def __reduce__(self):
+        return _ParamParser, (self.fullmatch.__self__.pattern, self.func)
+
 
 class NaiveLinearRouter(Router):
     """Linear (naive)"""
 
-    def __init__(self, mapping):
+    def __init__(self, mapping, adaptive=0):
         self._mapping_list = []
         for tupl in self._traverse(mapping):
             path_pat, handler_class, handler_methods = tupl
@@ -141,6 +769,11 @@ class NaiveLinearRouter(Router):
             t = (path_pat, path_rexp,
                  handler_class, handler_methods, param_names, param_funcs)
             self._mapping_list.append(t)
+        if adaptive:              # reorders routes per 'adaptive' hits
+            self._enable_adaptive(adaptive, {None: self._mapping_list})
+
+    def _reorder(self):
+        self._mapping_list = self._reorder_list(self._mapping_list, self._overlaps[None], 3)
 
     def find(self, req_path):
         for t in self._mapping_list:
@@ -156,7 +789,7 @@ class NaiveLinearRouter(Router):
 class PrefixLinearRouter(Router):
     """Linear (prefixstr)"""
 
-    def __init__(self, mapping):
+    def __init__(self, mapping, adaptive=0):
         self._mapping_list = []
         for tupl in self._traverse(mapping):
             path_pat, handler_class, handler_methods = tupl
@@ -165,6 +798,11 @@ class PrefixLinearRouter(Router):
             t = (path_pat, path_prefix, path_rexp,
                  handler_class, handler_methods, param_names, param_funcs)
             self._mapping_list.append(t)
+        if adaptive:              # reorders routes per 'adaptive' hits
+            self._enable_adaptive(adaptive, {None: self._mapping_list})
+
+    def _reorder(self):
+        self._mapping_list = self._reorder_list(self._mapping_list, self._overlaps[None], 4)
 
     def find(self, req_path):
         for t in self._mapping_list:
@@ -182,19 +820,24 @@ class PrefixLinearRouter(Router):
 class FixedLinearRouter(Router):
     """Linear (fixedpath)"""
 
-    def __init__(self, mapping):
+    def __init__(self, mapping, adaptive=0):
         self._mapping_dict = {}   # for urlpath having no parameters
         self._mapping_list = []   # for urlpath having any parameters
         for tupl in self._traverse(mapping):
             path_pat, handler_class, handler_methods = tupl
             if '{' not in path_pat:
-                self._mapping_dict[path_pat] = (handler_class, handler_methods, [])
+                self._mapping_dict[path_pat] = (handler_class, handler_methods, _NO_PARAMS)
             else:
                 path_prefix = path_pat.split('{', 1)[0]
                 path_rexp, param_names, param_funcs = self._compile(path_pat)
                 t = (path_pat, path_prefix, path_rexp,
                      handler_class, handler_methods, param_names, param_funcs)
                 self._mapping_list.append(t)
+        if adaptive:              # reorders routes per 'adaptive' hits
+            self._enable_adaptive(adaptive, {None: self._mapping_list})
+
+    def _reorder(self):
+        self._mapping_list = self._reorder_list(self._mapping_list, self._overlaps[None], 4)
 
     def find(self, req_path):
         tupl = self._mapping_dict.get(req_path)
@@ -215,7 +858,7 @@ class FixedLinearRouter(Router):
 class HashedLinearRouter(Router):
     """Linear (hashed by prefix)"""
 
-    def __init__(self, mapping, prefix_minlength_target=re.compile(r'^/\w')):
+    def __init__(self, mapping, prefix_minlength_target=re.compile(r'^/\w'), adaptive=0):
         self._mapping_dict = {}   # for urlpath having no parameters
         self._mapping_hash = {}   # for urlpath having any parameters
         self._hashkey_len  = 0
@@ -224,7 +867,7 @@ class HashedLinearRouter(Router):
         for tupl in self._traverse(mapping):
             path_pat, handler_class, handler_methods = tupl
             if '{' not in path_pat:
-                self._mapping_dict[path_pat] = (handler_class, handler_methods, [])
+                self._mapping_dict[path_pat] = (handler_class, handler_methods, _NO_PARAMS)
             else:
                 path_prefix = path_pat.split('{', 1)[0]
                 path_rexp, param_names, param_funcs = self._compile(path_pat)
@@ -254,6 +897,13 @@ class HashedLinearRouter(Router):
             hashtable[hashkey].append(t)
         if None not in hashtable:
             hashtable[None] = []
+        if adaptive:              # reorders routes in each bucket per 'adaptive' hits
+            self._enable_adaptive(adaptive, self._mapping_hash)
+
+    def _reorder(self):
+        hashtable = self._mapping_hash
+        for hashkey, mapping_list in hashtable.items():
+            hashtable[hashkey] = self._reorder_list(mapping_list, self._overlaps[hashkey], 4)
 
     def find(self, req_path):
         tupl = self._mapping_dict.get(req_path)
@@ -274,6 +924,42 @@ class HashedLinearRouter(Router):
                 return handler_class, handler_methods, param_args
         return None
 
+    def _find_each(self, req_paths):
+        if 'find' in self.__dict__:   # adaptive (counts hits in 'find()')
+            return Router._find_each(self, req_paths)
+        ## groups urlpaths by hash key, and tries each route of a bucket
+        ## against all urlpaths of the group at once
+        mapping_get = self._mapping_dict.get
+        hashtable = self._mapping_hash
+        n = self._hashkey_len
+        results = [ mapping_get(p) for p in req_paths ]
+        groups = {}   # {hashkey: [index, ...]}
+        for i, req_path in enumerate(req_paths):
+            if results[i]:
+                continue
+            hashkey = req_path[0:n]
+            if hashkey not in hashtable:
+                hashkey = None
+            groups.setdefault(hashkey, []).append(i)
+        for hashkey, indices in groups.items():
+            for t in hashtable[hashkey]:
+                _, path_prefix, path_rexp, handler_class, handler_methods, _, param_funcs = t
+                rest = []
+                for i in indices:
+                    req_path = req_paths[i]
+                    m = (path_rexp.match(req_path)
+                         if req_path.startswith(path_prefix) else None)
+                    if m:
+                        param_args = [ (f(s) if f is not None else s)
+                                           for s, f in zip(m.groups(), param_funcs) ]
+                        results[i] = (handler_class, handler_methods, param_args)
+                    else:
+                        rest.append(i)
+                if not rest:
+                    break
+                indices = rest
+        return results
+
 
 class NaiveRegexpRouter(Router):
     """Regexp (naive)"""
@@ -285,7 +971,7 @@ class NaiveRegexpRouter(Router):
         for tupl in self._traverse(mapping):
             path_pat, handler_class, handler_methods = tupl
             if '{' not in path_pat:
-                self._mapping_dict[path_pat] = (handler_class, handler_methods, [])
+                self._mapping_dict[path_pat] = (handler_class, handler_methods, _NO_PARAMS)
             else:
                 path_rexp, param_names, param_funcs = self._compile(path_pat)
                 t = (path_pat, pos + 1, len(param_names),
@@ -331,7 +1017,7 @@ class SmartRegexpRouter(Router):
         for tupl in self._traverse(mapping):
             path_pat, handler_class, handler_methods = tupl
             if '{' not in path_pat:
-                self._mapping_dict[path_pat] = (handler_class, handler_methods, [])
+                self._mapping_dict[path_pat] = (handler_class, handler_methods, _NO_PARAMS)
             else:
                 path_rexp, param_names, param_funcs = self._compile(path_pat)
                 t = (path_pat, path_rexp,
@@ -368,11 +1054,14 @@ class NestedRegexpRouter(Router):
     def __init__(self, mapping):
         self._mapping_dict = {}   # for urlpath having no parameters
         self._mapping_list = []   # for urlpath having any parameters
+        if isinstance(mapping, RouteTable):   # nested regexp needs tree of mapping
+            self._route_table = mapping
+            mapping = mapping.mapping
         all = []
         for tupl in self._traverse(mapping, "", all):
             path_pat, handler_class, handler_methods = tupl
             if '{' not in path_pat:
-                self._mapping_dict[path_pat] = (handler_class, handler_methods, [])
+                self._mapping_dict[path_pat] = (handler_class, handler_methods, _NO_PARAMS)
             else:
                 path_rexp, param_names, param_funcs = self._compile(path_pat)
                 t = (path_pat, path_rexp,
@@ -393,6 +1082,7 @@ class NestedRegexpRouter(Router):
                 self._validate(handler_class)
                 for path, handler_methods in handler_class.__mapping__:
                     full_path_pat = base_path+sub_path+path
+                    handler_methods = self._method_table(handler_methods, full_path_pat)
                     yield full_path_pat, handler_class, handler_methods
                     if '{' not in full_path_pat:
                         continue
@@ -430,6 +1120,8 @@ class NestedRegexpRouter(Router):
 class OptimizedRegexpRouter(Router):
     """Regexp (optimized)"""
 
+    CAPTURE_PARAMS = True    # capture params in '_all_regexp' (no need to match twice)
+
     def __init__(self, mapping):
         self._mapping_dict = {}   # for urlpath having no parameters
         self._mapping_list = []   # for urlpath having any parameters
@@ -437,53 +1129,127 @@ class OptimizedRegexpRouter(Router):
         for tupl in self._traverse(mapping):
             path_pat, handler_class, handler_methods = tupl
             if '{' not in path_pat:
-                self._mapping_dict[path_pat] = (handler_class, handler_methods, [])
+                self._mapping_dict[path_pat] = (handler_class, handler_methods, _NO_PARAMS)
             else:
                 tuples.append(tupl)
-        tree = self._build_tree(tuples)
-        callback = self._mapping_list.append
-        self._all_regexp = self._build_rexp(tree, callback)
+        self._tree = self._build_tree(tuples)
+        self._update_rexp()
+
+    def _update_rexp(self):
+        mapping_list = []
+        group_table  = {}   # {terminal group index: (handler_class, handler_methods, [(param group index, func)])}
+        def callback(t, index, param_indices):
+            mapping_list.append(t)
+            group_table[index] = (t[2], t[3], list(zip(param_indices, t[5])))
+        self._all_regexp = self._build_rexp(self._tree, callback)
+        self._mapping_list = mapping_list
+        self._group_table  = group_table
 
     def _build_tree(self, tuples):
         tree = []          # tuple list
         for t in tuples:
             urlpath_pattern, handler_class, handler_methods = t
-            if urlpath_pattern.endswith('.*'):
-                path_pat = urlpath_pattern[:-2]
-                suffix_rexp = r'(?:\.\w+)?'
-            else:
-                path_pat = urlpath_pattern
-                suffix_rexp = None
-            param_names = []
-            param_funcs = []
-            node = tree
-            sb = [r'^']
-            for text, pname, _ptype, prexp, pfunc in self._scan(path_pat):
-                if text:
-                    sb.append(self._escape(text))
-                    node2 = self._next_node(node, text)
-                    node = node2
-                if not pname:
-                    continue
-                if pname in param_names:
-                    raise RouterError("%s: parameter name '%s' duplicated." % (urlpath_pattern, pname))
-                param_names.append(pname)
-                param_funcs.append(pfunc)
-                sb.extend((r'(', prexp, r')'))
-                node = self._next_node(node, (prexp,))
-            if suffix_rexp:
-                sb.append(suffix_rexp)
-                node = self._next_node(node, (suffix_rexp,))
-            sb.append(r'$')
-            urlpath_rexp = re.compile("".join(sb))
-            tuple = (urlpath_pattern, urlpath_rexp,
-                     handler_class, handler_methods,
-                     param_names, param_funcs)
-            for pair in node:
-                assert pair[0] is None, "** internal error: pair[1]=%r" % (pair[1])
-            node.append((None, tuple))
+            self._add_to_tree(tree, urlpath_pattern, handler_class, handler_methods)
         return tree
 
+    def _add_to_tree(self, tree, urlpath_pattern, handler_class, handler_methods):
+        keys, urlpath_rexp, param_names, param_funcs = self._tree_keys(urlpath_pattern)
+        node = tree
+        for key in keys:
+            node = self._next_node(node, key)
+        tuple = (urlpath_pattern, urlpath_rexp,
+                 handler_class, handler_methods,
+                 param_names, param_funcs)
+        for pair in node:
+            if pair[0] is None:
+                raise RouterError("%s: duplicated urlpath (%s)." % (urlpath_pattern, pair[1][0]))
+        node.append((None, tuple))
+
+    def _tree_keys(self, urlpath_pattern):
+        if urlpath_pattern.endswith('.*'):
+            path_pat = urlpath_pattern[:-2]
+            suffix_rexp = r'(?:\.\w+)?'
+        else:
+            path_pat = urlpath_pattern
+            suffix_rexp = None
+        keys = []          # ex: ['/books/', ('\\d+',), '.json']
+        param_names = []
+        param_funcs = []
+        sb = [r'^']
+        for text, pname, _ptype, prexp, pfunc in self._scan(path_pat):
+            if text:
+                sb.append(self._escape(text))
+                keys.append(text)
+            if not pname:
+                continue
+            if pname in param_names:
+                raise RouterError("%s: parameter name '%s' duplicated." % (urlpath_pattern, pname))
+            param_names.append(pname)
+            param_funcs.append(pfunc)
+            sb.extend((r'(', prexp, r')'))
+            keys.append((prexp,))
+        if suffix_rexp:
+            sb.append(suffix_rexp)
+            keys.append((suffix_rexp, 'suffix'))   # not a param
+        sb.append(r'$')
+        urlpath_rexp = re.compile("".join(sb))
+        return keys, urlpath_rexp, param_names, param_funcs
+
+    def _remove_from_tree(self, node, keys, urlpath_pattern):
+        if not keys:
+            for i, (k, v) in enumerate(node):
+                if k is None and v[0] == urlpath_pattern:
+                    del node[i]
+                    return True
+            return False
+        key = keys[0]
+        for i, (k, v) in enumerate(node):
+            if isinstance(k, str):
+                if not (isinstance(key, str) and key.startswith(k)):
+                    continue
+                rest = key[len(k):]      # text key may be split into some nodes
+                keys2 = [rest] + keys[1:] if rest else keys[1:]
+            elif isinstance(k, tuple):
+                if k != key:
+                    continue
+                keys2 = keys[1:]
+            else:
+                continue
+            if not self._remove_from_tree(v, keys2, urlpath_pattern):
+                return False
+            if not v:            # remove empty node, otherwise it matches to anything
+                del node[i]
+            return True
+        return False
+
+    def add_route(self, urlpath_pattern, handler_class, handler_methods):
+        """adds new route, without rebuilding tree of other routes."""
+        self._validate(handler_class)         # validates as well as constructor
+        if '{' not in urlpath_pattern:
+            if urlpath_pattern in self._mapping_dict:
+                raise RouterError("%s: duplicated urlpath." % (urlpath_pattern,))
+        else:
+            self._tree_keys(urlpath_pattern)  # raises error when pattern is invalid
+        self._clear_caches()
+        handler_methods = self._method_table(handler_methods, urlpath_pattern)
+        if '{' not in urlpath_pattern:
+            self._mapping_dict[urlpath_pattern] = (handler_class, handler_methods, _NO_PARAMS)
+        else:
+            self._add_to_tree(self._tree, urlpath_pattern, handler_class, handler_methods)
+            self._update_rexp()
+
+    def remove_route(self, urlpath_pattern):
+        """removes existing route, without rebuilding tree of other routes."""
+        self._clear_caches()
+        if '{' not in urlpath_pattern:
+            if self._mapping_dict.pop(urlpath_pattern, None) is None:
+                raise RouterError("%s: urlpath not found." % (urlpath_pattern,))
+        else:
+            keys = self._tree_keys(urlpath_pattern)[0]
+            if not self._remove_from_tree(self._tree, keys, urlpath_pattern):
+                raise RouterError("%s: urlpath not found." % (urlpath_pattern,))
+            self._update_rexp()
+
     def _next_node(self, node, key):
         for i, (k, v) in enumerate(node):
             if isinstance(k, str):
@@ -526,11 +1292,13 @@ class OptimizedRegexpRouter(Router):
 
     def _build_rexp(self, tree, callback=None):
         sb = [r'^']
-        self.__build_rexp(tree, sb, callback)
+        self.__build_rexp(tree, sb, callback, [], [0])
         sb.append(r'$')
         return re.compile("".join(sb))
 
-    def __build_rexp(self, node, sb, callback):
+    def __build_rexp(self, node, sb, callback, param_indices, counter):
+        ## 'param_indices' is a stack of group indices of params captured so far,
+        ## and 'counter' is a number of groups emitted so far.
         if len(node) > 1:
             sb.append(r'(?:')
         i = 0
@@ -541,16 +1309,24 @@ class OptimizedRegexpRouter(Router):
             i += 1
             if k is None:
                 sb.append(r'($)')
+                counter[0] += 1
                 if callback:
-                    callback(v)
+                    callback(v, counter[0], tuple(param_indices))
             elif isinstance(k, str):
                 text = k
                 sb.append(self._escape(text))
-                self.__build_rexp(v, sb, callback)
+                self.__build_rexp(v, sb, callback, param_indices, counter)
             elif isinstance(k, tuple):
                 prexp = k[0]
-                sb.append(prexp)
-                self.__build_rexp(v, sb, callback)
+                if self.CAPTURE_PARAMS and len(k) == 1:   # param (not suffix)
+                    sb.extend((r'(', prexp, r')'))
+                    counter[0] += 1
+                    param_indices.append(counter[0])
+                    self.__build_rexp(v, sb, callback, param_indices, counter)
+                    param_indices.pop()
+                else:
+                    sb.append(prexp)
+                    self.__build_rexp(v, sb, callback, param_indices, counter)
             else:
                 assert False, "** internal error: k=%r" % (k,)
         if len(node) > 1:
@@ -566,20 +1342,42 @@ class OptimizedRegexpRouter(Router):
         if m is None:
             return None
         #
-        #idx = m.groups().index("")  # ex: m.groups() == [None, None, "", None]
-        idx = m.lastindex - 1
-        #
-        _, path_rexp, handler_class, handler_methods, _, param_funcs = self._mapping_list[idx]
-        m2 = path_rexp.match(req_path)
-        param_args = [ (f(s) if f is not None else s)
-                           for s, f in zip(m2.groups(), param_funcs) ]
+        ## 'm.lastindex' is the index of terminal group '($)' matched
+        handler_class, handler_methods, pairs = self._group_table[m.lastindex]
+        param_args = [ (f(m.group(j)) if f is not None else m.group(j))
+                           for j, f in pairs ]
         return handler_class, handler_methods, param_args
 
+    def _match_dynamic(self, req_path):
+        ## builds params tuple from match groups directly (no list of 'find()')
+        if not self._mapping_list:
+            return None
+        m = self._all_regexp.match(req_path)
+        if m is None:
+            return None
+        handler_class, handler_methods, pairs = self._group_table[m.lastindex]
+        route_id, path_pat, param_names = handler_methods.route
+        group = m.group
+        return RouteMatch(route_id, path_pat, handler_class, handler_methods, param_names,
+                          tuple([ (f(group(j)) if f is not None else group(j))
+                                      for j, f in pairs ]))
+
+
+class _RedirectRegexpBuilder(OptimizedRegexpRouter):
+    """builds regexp for 'Router.build_redirects()' (not a router)"""
+
+    CAPTURE_PARAMS = False
+
+    def __init__(self):
+        pass      # only '_build_tree()' and '_build_rexp()' are used
+
 
 class SlicedRegexpRouter(OptimizedRegexpRouter):
 
-    def __init__(self, mapping):
-        OptimizedRegexpRouter.__init__(self, mapping)
+    CAPTURE_PARAMS = False   # params are extracted by slicing
+
+    def _update_rexp(self):
+        OptimizedRegexpRouter._update_rexp(self)
         new_list = []
         for t in self._mapping_list:
             urlpath_pattern = t[0]
@@ -587,22 +1385,6 @@ class SlicedRegexpRouter(OptimizedRegexpRouter):
             new_list.append(t + (slice_, sep, has_suffix))
         self._mapping_list = new_list
 
-    def _slice(self, urlpath_pattern, _separator=re.compile(r'\{.*?\}')):
-        has_suffix = urlpath_pattern.endswith('.*')
-        if has_suffix:
-            urlpath_pattern = urlpath_pattern[:-2]  # ex: '/{id}.*' => '/{id}'
-        arr = _separator.split(urlpath_pattern)     # ex: '/books/{id}.json' => ('/books/', 'json')
-        if len(arr) == 2:
-            l_idx = len(arr[0])
-            r_idx = - len(arr[1]) or None
-            return slice(l_idx, r_idx), None, has_suffix
-        elif len(arr) == 3 and arr[1] != "":
-            l_idx = len(arr[0])
-            r_idx = - len(arr[2]) or None
-            return slice(l_idx, r_idx), arr[1], has_suffix
-        else:
-            return None, None, has_suffix
-
     def find(self, req_path):
         tupl = self._mapping_dict.get(req_path)
         if tupl:
@@ -620,22 +1402,58 @@ class SlicedRegexpRouter(OptimizedRegexpRouter):
          _, param_funcs, slice_, sep, has_suffix) = self._mapping_list[idx]
         if slice_:
             if has_suffix:
-                req_path = splitext(req_path)[0]     # ex: "/123.json" -> "/123"
+                req_path = _split_suffix(req_path)[0]   # ex: "/123.json" -> "/123"
             s = req_path[slice_]                     # ex: "/books/123/comments/456.json" -> "123/comments/456"
             if sep is None:
                 fn = param_funcs[0]
-                param_args = [fn(s) if fn else s]    # ex: "123" -> [123]
+                return handler_class, handler_methods, [fn(s) if fn else s]  # ex: "123" -> [123]
+            if sep.__class__ is str:
+                values = s.split(sep, len(param_funcs) - 1)  # ex: "123/comments/456" -> ["123", "456"]
             else:
-                s1, s2 = s.split(sep)                # ex: "123/comments/456" -> ["123", "456"]
-                fn1, fn2 = param_funcs
-                param_args = [(fn1(s1) if fn1 else s1),   # ex: ["123", "456"] -> [123, 456]
-                              (fn1(s2) if fn2 else s2),]
+                values = []
+                for sep_ in sep:                     # ex: ("/pulls/", "/reviews/")
+                    value, s = s.split(sep_, 1)
+                    values.append(value)
+                values.append(s)
+            param_args = [ (fn(v) if fn else v)      # ex: ["123", "456"] -> [123, 456]
+                               for v, fn in zip(values, param_funcs) ]
         else:
             m2 = path_rexp.match(req_path)
             param_args = [ (fn(s) if fn else s)
                                for s, fn in zip(m2.groups(), param_funcs) ]
         return handler_class, handler_methods, param_args
 
+    def _match_dynamic(self, req_path):
+        ## builds params tuple from slice directly (no list of 'find()')
+        if not self._mapping_list:
+            return None
+        m = self._all_regexp.match(req_path)
+        if m is None:
+            return None
+        (_, path_rexp, handler_class, handler_methods,
+         _, param_funcs, slice_, sep, has_suffix) = self._mapping_list[m.lastindex - 1]
+        route_id, path_pat, param_names = handler_methods.route
+        if not slice_:
+            values = path_rexp.match(req_path).groups()
+        else:
+            if has_suffix:
+                req_path = _split_suffix(req_path)[0]
+            s = req_path[slice_]
+            if sep is None:
+                fn = param_funcs[0]
+                return RouteMatch(route_id, path_pat, handler_class, handler_methods,
+                                  param_names, (fn(s) if fn else s,))
+            if sep.__class__ is str:
+                values = s.split(sep, len(param_funcs) - 1)
+            else:
+                values = []
+                for sep_ in sep:
+                    value, s = s.split(sep_, 1)
+                    values.append(value)
+                values.append(s)
+        return RouteMatch(route_id, path_pat, handler_class, handler_methods, param_names,
+                          tuple([ (fn(v) if fn else v) for v, fn in zip(values, param_funcs) ]))
+
 
 class HashedRegexpRouter(Router):
     """Regexp (hashed)"""
@@ -643,9 +1461,15 @@ class HashedRegexpRouter(Router):
     #SUBROUTER_CLASS = OptimizedRegexpRouter
     SUBROUTER_CLASS = SlicedRegexpRouter
 
-    def __init__(self, mapping, prefix_minlength_target=re.compile(r'^/\w')):
+    def __init__(self, mapping, prefix_minlength_target=re.compile(r'^/\w'),
+                 lazy=False, max_shards=0):
         self._mapping_dict = {}   # for urlpath having no parameters
         self._subrouters   = {}   # {prefix: OptimizedRegexpRouter}
+        self._shards       = {}   # {prefix: pairs} (for lazy mode)
+        self._pinned       = set()  # prefixes of shards updated by add_route()
+        self._max_shards   = max_shards
+        self._loads = self._unloads = 0
+        self._lazy         = lazy or max_shards > 0
         #
         x = prefix_minlength_target
         rexp = (re.compile(r'.') if x is None else
@@ -659,19 +1483,85 @@ class HashedRegexpRouter(Router):
         #
         groups = {}
         for pair in pairs:
-            prefix = pair[0][:minlen]
-            if prefix.find('{') >= 0 or len(prefix) < minlen:
-                prefix = ""
+            prefix = self._prefix_of(pair[0])
             pairs_ = groups.setdefault(prefix, [])
             pairs_.append(pair)
         #
+        if isinstance(mapping, RouteTable):
+            groups = { prefix: mapping._subset([ route for _, route in pairs_ ])
+                           for prefix, pairs_ in groups.items() }
+        #
+        ## route ids are numbered through all subrouters (in order of groups)
+        self._shard_offsets = {}  # {prefix: first route id} (for lazy mode)
+        if self._lazy:            # builds subrouter on first find() into prefix
+            self._subrouters = OrderedDict()
+            for prefix, pairs_ in groups.items():
+                self._shards[prefix] = pairs_
+                self._shard_offsets[prefix] = self._route_count
+                for path_pat, handler_class, handler_methods in Router._traverse(self, pairs_):
+                    if '{' not in path_pat:
+                        self._mapping_dict[path_pat] = (handler_class, handler_methods, _NO_PARAMS)
+            self.find = self._lazy_find
+            return
         for prefix, pairs_ in groups.items():
-            subrouter = self.SUBROUTER_CLASS(pairs_)
+            subrouter = self._new_subrouter(pairs_, self._route_count)
+            self._route_count = subrouter._route_count
             self._mapping_dict.update(subrouter._mapping_dict)
             subrouter._mapping_dict.clear()
             self._subrouters[prefix] = subrouter
 
+    def _new_subrouter(self, pairs, route_id_offset):
+        klass = self.SUBROUTER_CLASS
+        subrouter = klass.__new__(klass)
+        subrouter._route_count = route_id_offset
+        subrouter.__init__(pairs)
+        return subrouter
+
+    def _prefix_of(self, path_pat):
+        minlen = self._prefix_minlength
+        prefix = path_pat[:minlen]
+        if prefix.find('{') >= 0 or len(prefix) < minlen:
+            prefix = ""
+        return prefix
+
+    def add_route(self, urlpath_pattern, handler_class, handler_methods):
+        """adds new route, rebuilding only the subrouter of its prefix."""
+        self._validate(handler_class)
+        self._clear_caches()
+        if '{' not in urlpath_pattern:
+            if urlpath_pattern in self._mapping_dict:
+                raise RouterError("%s: duplicated urlpath." % (urlpath_pattern,))
+            handler_methods = self._method_table(handler_methods, urlpath_pattern)
+            self._mapping_dict[urlpath_pattern] = (handler_class, handler_methods, _NO_PARAMS)
+            return
+        prefix = self._prefix_of(urlpath_pattern)
+        subrouter = self._shard(prefix)
+        if subrouter is None:
+            subrouter = self._subrouters[prefix] = self.SUBROUTER_CLASS([])
+        self._pinned.add(prefix)  # never unloaded, because pairs don't have new route
+        subrouter._route_count = self._route_count   # keeps route id unique
+        subrouter.add_route(urlpath_pattern, handler_class, handler_methods)
+        self._route_count = subrouter._route_count
+
+    def remove_route(self, urlpath_pattern):
+        """removes existing route, rebuilding only the subrouter of its prefix."""
+        self._clear_caches()
+        if '{' not in urlpath_pattern:
+            if self._mapping_dict.pop(urlpath_pattern, None) is None:
+                raise RouterError("%s: urlpath not found." % (urlpath_pattern,))
+            return
+        prefix = self._prefix_of(urlpath_pattern)
+        subrouter = self._shard(prefix)
+        if subrouter is None:
+            raise RouterError("%s: urlpath not found." % (urlpath_pattern,))
+        subrouter.remove_route(urlpath_pattern)
+        self._pinned.add(prefix)
+
     def _traverse(self, mapping, base_path="", mapping_class=None):
+        if isinstance(mapping, RouteTable):   # grouped by urlpath pattern of route
+            for route in mapping.routes:
+                yield route[0], route
+            return
         if mapping_class is None:
             mapping_class = type(mapping)
         for sub_path, obj in self._each_keyval(mapping):
@@ -696,15 +1586,286 @@ class HashedRegexpRouter(Router):
             return subrouter.find(req_path)
         return None
 
+    def _snapshot_state(self):
+        state = dict(self.__dict__)
+        state.pop('find', None)   # bound method (lazy mode)
+        return state
+
+    def _restore_state(self, state):
+        Router._restore_state(self, state)
+        if self._lazy:
+            self.find = self._lazy_find
+
+    def _lazy_find(self, req_path):
+        tupl = self._mapping_dict.get(req_path)
+        if tupl:
+            return tupl
+        subrouter = self._shard(req_path[:self._prefix_minlength])
+        if subrouter is not None:
+            tupl = subrouter.find(req_path)
+            if tupl is not None:
+                return tupl
+        subrouter = self._shard("")
+        if subrouter is not None:
+            return subrouter.find(req_path)
+        return None
+
+    def _shard(self, prefix):
+        ## returns subrouter of prefix, building it if not loaded yet
+        subrouters = self._subrouters
+        subrouter = subrouters.get(prefix)
+        if subrouter is not None:
+            if self._max_shards:
+                try:
+                    subrouters.move_to_end(prefix)
+                except KeyError:   # unloaded by other thread
+                    pass
+            return subrouter
+        pairs_ = self._shards.get(prefix)
+        if pairs_ is None:
+            return None
+        subrouter = self._new_subrouter(pairs_, self._shard_offsets[prefix])
+        subrouter._mapping_dict.clear()     # already in self._mapping_dict
+        subrouters[prefix] = subrouter
+        self._loads += 1
+        if self._max_shards and len(subrouters) > self._max_shards:
+            self._unload_idle_shards()
+        return subrouter
+
+    def _unload_idle_shards(self):
+        subrouters = self._subrouters
+        for prefix in list(subrouters):     # least recently used first
+            if len(subrouters) <= self._max_shards:
+                break
+            if prefix in self._pinned or prefix not in self._shards:
+                continue
+            if subrouters.pop(prefix, None) is not None:
+                self._unloads += 1
+
+    def shard_info(self):
+        return {"shards": len(self._shards) or len(self._subrouters),
+                "loaded": len(self._subrouters), "maxsize": self._max_shards,
+                "loads": self._loads, "unloads": self._unloads}
+
+    def _find_each(self, req_paths):
+        ## groups urlpaths by prefix, and resolves each group by subrouter
+        mapping_get = self._mapping_dict.get
+        minlen = self._prefix_minlength
+        results = [ mapping_get(p) for p in req_paths ]
+        groups = {}   # {prefix: [index, ...]}
+        for i, req_path in enumerate(req_paths):
+            if not results[i]:
+                groups.setdefault(req_path[:minlen], []).append(i)
+        fallbacks = []
+        for prefix, indices in groups.items():
+            subrouter = self._shard(prefix) if prefix else None
+            if subrouter is None:
+                fallbacks.extend(indices)
+                continue
+            find = subrouter.find
+            for i in indices:
+                tupl = find(req_paths[i])
+                if tupl is None:
+                    fallbacks.append(i)
+                else:
+                    results[i] = tupl
+        subrouter = self._shard("") if fallbacks else None
+        if subrouter is not None:
+            find = subrouter.find
+            for i in fallbacks:
+                results[i] = find(req_paths[i])
+        return results
+
+
+class ShardedRegexpRouter(Router):
+    """Regexp (sharded by path segment)"""
+
+    SUBROUTER_CLASS = SlicedRegexpRouter
+
+    class Shard(object):
+        __slots__ = ('children', 'wildcard', 'subrouter', 'first', 'own_first')
+        def __init__(self):
+            self.children  = {}     # {static segment: Shard}
+            self.wildcard  = None   # Shard for routes having param in segment
+            self.subrouter = None   # router for routes which are not sharded more
+            self.first     = sys.maxsize   # lowest route id in this shard and children
+            self.own_first = sys.maxsize   # lowest route id in subrouter
+
+    def __init__(self, mapping, max_routes=64):
+        self._mapping_dict = {}   # for urlpath having no parameters
+        self._max_routes   = max_routes
+        table = mapping if isinstance(mapping, RouteTable) else RouteTable(mapping)
+        self._route_table = table
+        self._route_count = table.route_count
+        routes = []
+        for route in table.routes:
+            path_pat, handler_class, handler_methods = route
+            if '{' not in path_pat:
+                self._mapping_dict[path_pat] = (handler_class, handler_methods, _NO_PARAMS)
+            else:
+                routes.append((self._split_segments(path_pat), route))
+        self._root = self._build_shard(routes, 1, table)
+
+    def _build_shard(self, routes, depth, table):
+        ## splits routes by segment at depth while they exceed max routes,
+        ## therefore shard depth follows distribution of routes
+        shard = self.Shard()
+        if len(routes) <= self._max_routes:
+            if routes:
+                self._set_subrouter(shard, table, [ r for _, r in routes ])
+            return shard
+        groups = {}   # {static segment or None: routes}
+        rest = []     # routes ending before depth or having 'path' param in segment
+        for segs, route in routes:
+            key = self._shard_key(segs, depth)
+            if key is False:
+                rest.append(route)
+            else:
+                groups.setdefault(key, []).append((segs, route))
+        for key, routes_ in groups.items():
+            child = self._build_shard(routes_, depth+1, table)
+            if key is None:
+                shard.wildcard = child
+            else:
+                shard.children[key] = child
+            shard.first = min(shard.first, child.first)
+        if rest:
+            self._set_subrouter(shard, table, rest)
+        return shard
+
+    def _shard_key(self, segs, depth):
+        ## returns static segment, None (param in segment) or False (not sharded)
+        if depth >= len(segs):
+            return False
+        seg = segs[depth]
+        if '{' not in seg and not seg.endswith('.*'):   # ex: 'index.*' matches 'index.json'
+            return seg
+        if self._has_path_param(seg):   # may match to '/'
+            return False
+        return None
+
+    def _set_subrouter(self, shard, table, routes):
+        ## route ids are kept, because routes are passed as part of table
+        shard.subrouter = self.SUBROUTER_CLASS(table._subset(routes))
+        shard.own_first = min( route[2].route[0] for route in routes )
+        shard.first = min(shard.first, shard.own_first)
+
+    def _shards_of(self, urlpath_pattern):
+        ## returns shards from root to the shard which has (or should have)
+        ## subrouter for urlpath pattern
+        segs = self._split_segments(urlpath_pattern)
+        shards = [self._root]
+        depth = 1
+        while True:
+            shard = shards[-1]
+            key = self._shard_key(segs, depth)
+            child = (False if key is False else
+                     shard.wildcard if key is None else
+                     shard.children.get(key))
+            if not child:
+                return shards
+            shards.append(child)
+            depth += 1
+
+    def add_route(self, urlpath_pattern, handler_class, handler_methods):
+        """adds new route, rebuilding only the subrouter of its shard."""
+        self._validate(handler_class)
+        self._clear_caches()
+        if '{' not in urlpath_pattern:
+            if urlpath_pattern in self._mapping_dict:
+                raise RouterError("%s: duplicated urlpath." % (urlpath_pattern,))
+            handler_methods = self._method_table(handler_methods, urlpath_pattern)
+            self._mapping_dict[urlpath_pattern] = (handler_class, handler_methods, _NO_PARAMS)
+            return
+        shards = self._shards_of(urlpath_pattern)
+        shard = shards[-1]
+        subrouter = shard.subrouter
+        if subrouter is None:
+            subrouter = shard.subrouter = self.SUBROUTER_CLASS([])
+        route_id = self._route_count
+        subrouter._route_count = route_id   # keeps route id unique
+        subrouter.add_route(urlpath_pattern, handler_class, handler_methods)
+        self._route_count = subrouter._route_count
+        shard.own_first = min(shard.own_first, route_id)
+        for shard in shards:
+            shard.first = min(shard.first, route_id)
+
+    def remove_route(self, urlpath_pattern):
+        """removes existing route, rebuilding only the subrouter of its shard."""
+        self._clear_caches()
+        if '{' not in urlpath_pattern:
+            if self._mapping_dict.pop(urlpath_pattern, None) is None:
+                raise RouterError("%s: urlpath not found." % (urlpath_pattern,))
+            return
+        ## ('first' of shards may be lower than actual, which is harmless)
+        subrouter = self._shards_of(urlpath_pattern)[-1].subrouter
+        if subrouter is None:
+            raise RouterError("%s: urlpath not found." % (urlpath_pattern,))
+        subrouter.remove_route(urlpath_pattern)
+
+    def find(self, req_path):
+        tupl = self._mapping_dict.get(req_path)
+        if tupl:
+            return tupl  # ex: (BooksAPI, {'GET':do_index, 'POST':do_create}, [])
+        found = self._search(self._root, req_path.split('/'), 1, req_path, sys.maxsize)
+        return found[1] if found is not None else None
+
+    def _search(self, shard, segs, depth, req_path, bound):
+        ## returns '(route_id, tuple)' of the first declared route (whose id
+        ## is lower than 'bound'), because other shards may have prior route
+        n = len(segs)
+        while shard.wildcard is None and shard.subrouter is None:
+            if depth == n:                   # follows static segments while
+                return None                  # no other shard can match
+            shard = shard.children.get(segs[depth])
+            if shard is None:
+                return None
+            depth += 1
+        found = None
+        if depth < n:
+            for child in (shard.children.get(segs[depth]), shard.wildcard):
+                if child is not None and child.first < bound:
+                    x = self._search(child, segs, depth+1, req_path, bound)
+                    if x is not None:
+                        found = x
+                        bound = x[0]
+        if shard.subrouter is not None and shard.own_first < bound:
+            tupl = shard.subrouter.find(req_path)
+            if tupl is not None:
+                route_id = tupl[1].route[0]
+                if route_id < bound:
+                    found = (route_id, tupl)
+        return found
+
+    def shard_info(self):
+        sizes = {}   # {shard path (ex: '/api/v1/*'): number of routes}
+        depth = 0
+        stack = [(self._root, "")]
+        while stack:
+            shard, path = stack.pop()
+            if shard.subrouter is not None:
+                sizes[path or "/"] = len(shard.subrouter._mapping_list)
+                depth = max(depth, path.count('/'))
+            for seg, child in shard.children.items():
+                stack.append((child, path+"/"+seg))
+            if shard.wildcard is not None:
+                stack.append((shard.wildcard, path+"/*"))
+        n = len(sizes)
+        return {"shards": n, "depth": depth, "max_routes": self._max_routes,
+                "largest": max(sizes.values()) if n else 0,
+                "average": sum(sizes.values()) / n if n else 0.0,
+                "sizes": sizes}
+
 
 class TrieRouter(Router):
     """Trie-base router"""
 
     class Node(object):
-        __slots__ = ('children', 'target')
+        __slots__ = ('children', 'targets', 'backtrack')
         def __init__(self):
-            self.children = {}
-            self.target   = None
+            self.children  = {}
+            self.targets   = None    # {suffix: target} (ex: {'.json': t1, '.*': t2})
+            self.backtrack = False   # True if edges overlap in this subtree
 
     PARAM_TYPES = {'int': 1, 'str': 2, 'path': 3}
 
@@ -714,9 +1875,39 @@ class TrieRouter(Router):
         for tupl in self._traverse(mapping):
             path_pat, handler_class, handler_methods = tupl
             if '{' not in path_pat:
-                self._mapping_dict[path_pat] = (handler_class, handler_methods, [])
+                self._mapping_dict[path_pat] = (handler_class, handler_methods, _NO_PARAMS)
             else:
                 self._register(path_pat, handler_class, handler_methods)
+        self._backtracking = self._mark_backtrack(self._tree_root)
+        self._suffixes = self._suffix_index(self._each_targets(self._tree_root),
+                                            self._has_path_edge(self._tree_root))
+
+    def _each_targets(self, node):
+        if node.targets is not None:
+            yield node.targets
+        for key, child in node.children.items():
+            for child2 in (child if key == 4 else [(None, None, child)]):
+                yield from self._each_targets(child2[2])
+
+    def _has_path_edge(self, node):
+        if 3 in node.children:    # 3: path
+            return True
+        return any( self._has_path_edge(child2[2])
+                        for key, child in node.children.items()
+                            for child2 in (child if key == 4 else [(None, None, child)]) )
+
+    def _mark_backtrack(self, node):
+        ## marks subtrees which have a node where a segment can be accepted
+        ## by two or more edges; failure in other subtrees is final.
+        flag = self._edges_overlap(node.children)
+        for key, child in node.children.items():
+            if key == 4:      # 4: custom types
+                for _, _, child2 in child:
+                    flag = self._mark_backtrack(child2) or flag
+            else:
+                flag = self._mark_backtrack(child) or flag
+        node.backtrack = flag
+        return flag
 
     def _register(self, path_pat, handler_class, handler_methods):
         assert path_pat.startswith('/') or not path, "** path_pat=%r" % (path_pat,)
@@ -738,31 +1929,52 @@ class TrieRouter(Router):
                 pnames.append(pname)
                 if ptype is None:
                     ptype = self._guess_ptype(pname)   # 'int' if 'id' or 'xxx_id'
-                if ptype not in param_types:
-                    raise RouterError("%s: unknown parameter type %r." % (path_pat, ptype))
-                key = param_types[ptype]               # ex: 1 (int) or 2 (str)
+                if ptype in param_types:
+                    key = param_types[ptype]           # ex: 1 (int) or 2 (str)
+                else:
+                    node = self._custom_child(node, path_pat, ptype)
+                    continue
             else:
                 key = item                             # ex: "users"
             if key not in node.children:
                 node.children[key] = self.Node()
             node = node.children[key]
         #
-        if node.target is not None:
+        if node.targets is None:
+            node.targets = {}
+        t = node.targets.get(suffix)
+        if t is not None:
             raise RouterError("%s: duplicated urlpath in %s and %s." %
-                              (path_pat, node.target[0].__name__, handler_class.__name__))
-        node.target = (handler_class, handler_methods, pnames, suffix)
+                              (path_pat, t[0].__name__, handler_class.__name__))
+        node.targets[suffix] = (handler_class, handler_methods, pnames, suffix)
+
+    def _custom_child(self, node, path_pat, ptype):
+        parser = self.URLPATH_PARAM_PARSERS.get(ptype)
+        if parser is None:
+            raise RouterError("%s: unknown parameter type %r." % (path_pat, ptype))
+        entries = node.children.setdefault(4, [])   # 4: custom types
+        for ptype_, _, child in entries:
+            if ptype_ == ptype:
+                return child
+        child = self.Node()
+        entries.append((ptype, parser, child))  # ex: ('uuid', parser, Node())
+        return child
 
     def find(self, req_path):
         tupl = self._mapping_dict.get(req_path)
         if tupl:
             return tupl  # ex: (BooksAPI, {'GET':do_index, 'POST':do_create}, [])
         #
-        path, suffix = splitext(req_path)
+        path, suffix = _split_suffix(req_path)
+        suffixes = self._suffixes
+        if suffixes is not None and suffix not in suffixes:
+            return None   # no route accepts the suffix
         items = path.split('/')
         if path.startswith('/'):
             items.pop(0)
         #
         node = self._tree_root
+        int_values = self.SEGMENT_CLASSIFIER.int_values   # cache of hot segments
         param_args = []
         i = -1
         for item in items:
@@ -774,15 +1986,26 @@ class TrieRouter(Router):
             #
             node2 = node.children.get(1)  # 1: int
             if node2 is not None:
-                try:
-                    intval = int(item)
-                except ValueError:
-                    pass
+                intval = int_values.get(item)
+                if intval is None:
+                    intval = self.SEGMENT_CLASSIFIER.int_value(item)
+                if intval >= 0:
+                    param_args.append(intval)
+                    node = node2
+                    continue
+            #
+            entries = node.children.get(4)  # 4: custom types
+            if entries is not None:
+                for _, parser, node2 in entries:
+                    val = parser(item)
+                    if val is not None:
+                        break
                 else:
-                    if intval >= 0:
-                        param_args.append(intval)
-                        node = node2
-                        continue
+                    node2 = None
+                if node2 is not None:
+                    param_args.append(val)
+                    node = node2
+                    continue
             #
             node2 = node.children.get(2)  # 2: str
             if node2 is not None:
@@ -798,15 +2021,167 @@ class TrieRouter(Router):
                 node = node2
                 break
             #
-            return None
+            return self._backtrack(req_path) if self._backtracking else None
         #
-        t = node.target
-        if t is None:
-            return None
-        handler_class, handler_methods, param_names, expected_suffix = t
-        if not self._is_valid_suffix(suffix, expected_suffix):
-            return None
-        return handler_class, handler_methods, param_args
+        targets = node.targets
+        if targets is not None:
+            t = targets.get(suffix) or targets.get('.*')
+            if t is not None:
+                return t[0], t[1], param_args
+        return self._backtrack(req_path) if self._backtracking else None
+
+    def _backtrack(self, req_path, root=None):
+        ## called when greedy lookup failed; searches other edges in the
+        ## same order (static, int, custom, str, and path) depth-first.
+        path, suffix = _split_suffix(req_path)
+        items = path.split('/')
+        if path.startswith('/'):
+            items.pop(0)
+        return self._search(root or self._tree_root, items, 0, suffix, [], True)
+
+    def _search(self, node, items, i, suffix, param_args, greedy):
+        ## 'greedy' is True while following the path of greedy lookup
+        if i == len(items):
+            return self._accept(node.targets, suffix, param_args)
+        item = items[i]
+        children = node.children
+        for child, args in self._accepting_edges(children, item):
+            ## greedy lookup has already failed in subtree without overlap
+            if greedy and not child.backtrack:
+                greedy = False
+                continue
+            t = self._search(child, items, i+1, suffix, param_args + args, greedy)
+            if t is not None:
+                return t
+            greedy = False
+        child = children.get(3)  # 3: path
+        if child is not None:
+            args = ["/".join(items[i:]) + suffix]
+            return self._accept(child.targets, "", param_args + args)
+        return None
+
+
+class RadixTrieRouter(TrieRouter):
+    """Trie-base router which merges static segments without branch"""
+
+    class RadixNode(object):
+        __slots__ = ('edges', 'rest', 'int_child', 'custom', 'str_child', 'path_child', 'targets')
+        def __init__(self):
+            self.edges      = {}     # {static segment: node}
+            self.rest       = ()     # static segments merged into this node
+            self.int_child  = None
+            self.custom     = None   # list of (ptype, parser, node)
+            self.str_child  = None
+            self.path_child = None
+            self.targets    = None   # {suffix: target}
+
+    def __init__(self, mapping):
+        TrieRouter.__init__(self, mapping)
+        ## uncompressed trie is kept only for backtracking (when edges overlap)
+        self._backtrack_root = self._tree_root if self._backtracking else None
+        self._tree_root = self._compress(self._tree_root)
+
+    def _compress(self, node):
+        rnode = self.RadixNode()
+        rnode.targets = node.targets
+        for key, child in node.children.items():
+            if isinstance(key, str):
+                ## ex: 'actions' -> 'runners' -> 'generate-jitconfig'
+                ##     => {'actions': node(rest=('runners', 'generate-jitconfig'))}
+                rest = []
+                while child.targets is None and len(child.children) == 1:
+                    key2, child2 = next(iter(child.children.items()))
+                    if not isinstance(key2, str):
+                        break
+                    rest.append(key2)
+                    child = child2
+                rnode2 = self._compress(child)
+                rnode2.rest = tuple(rest)
+                rnode.edges[key] = rnode2
+            elif key == 1:    # 1: int
+                rnode.int_child = self._compress(child)
+            elif key == 2:    # 2: str
+                rnode.str_child = self._compress(child)
+            elif key == 3:    # 3: path
+                rnode.path_child = self._compress(child)
+            elif key == 4:    # 4: custom types
+                rnode.custom = [ (ptype, parser, self._compress(child2))
+                                     for ptype, parser, child2 in child ]
+            else:
+                assert False, "** internal error: key=%r" % (key,)
+        return rnode
+
+    def find(self, req_path):
+        tupl = self._mapping_dict.get(req_path)
+        if tupl:
+            return tupl  # ex: (BooksAPI, {'GET':do_index, 'POST':do_create}, [])
+        #
+        path, suffix = _split_suffix(req_path)
+        suffixes = self._suffixes
+        if suffixes is not None and suffix not in suffixes:
+            return None   # no route accepts the suffix
+        items = path.split('/')
+        if path.startswith('/'):
+            items.pop(0)
+        #
+        node = self._tree_root
+        int_values = self.SEGMENT_CLASSIFIER.int_values   # cache of hot segments
+        param_args = []
+        it = iter(items)
+        for item in it:
+            child = node.edges.get(item)
+            if child is not None:
+                node = child
+                if node.rest:                  # ex: ('runners', 'generate-jitconfig')
+                    for seg in node.rest:
+                        if next(it, None) != seg:
+                            return (self._backtrack(req_path, self._backtrack_root)
+                                    if self._backtracking else None)
+                continue
+            #
+            child = node.int_child
+            if child is not None:
+                intval = int_values.get(item)
+                if intval is None:
+                    intval = self.SEGMENT_CLASSIFIER.int_value(item)
+                if intval >= 0:
+                    param_args.append(intval)
+                    node = child
+                    continue
+            #
+            if node.custom is not None:
+                for _, parser, child in node.custom:
+                    val = parser(item)
+                    if val is not None:
+                        break
+                else:
+                    child = None
+                if child is not None:
+                    param_args.append(val)
+                    node = child
+                    continue
+            #
+            child = node.str_child
+            if child is not None and item:
+                param_args.append(item)
+                node = child
+                continue
+            #
+            child = node.path_child
+            if child is not None:
+                param_args.append("/".join([item, *it]) + suffix)
+                suffix = ""
+                node = child
+                break
+            #
+            return self._backtrack(req_path, self._backtrack_root) if self._backtracking else None
+        #
+        targets = node.targets
+        if targets is not None:
+            t = targets.get(suffix) or targets.get('.*')
+            if t is not None:
+                return t[0], t[1], param_args
+        return self._backtrack(req_path, self._backtrack_root) if self._backtracking else None
 
 
 class StateMachineRouter(Router):
@@ -820,9 +2195,50 @@ class StateMachineRouter(Router):
         for tupl in self._traverse(mapping):
             path_pat, handler_class, handler_methods = tupl
             if '{' not in path_pat:
-                self._mapping_dict[path_pat] = (handler_class, handler_methods, [])
+                self._mapping_dict[path_pat] = (handler_class, handler_methods, _NO_PARAMS)
             else:
                 self._register(path_pat, handler_class, handler_methods)
+        self._backtracking = self._mark_backtrack(self._transition)
+        self._suffixes = self._suffix_index(self._each_targets(self._transition),
+                                            self._has_path_edge(self._transition))
+
+    def _each_targets(self, d):
+        for key, d2 in d.items():
+            if key is None:
+                yield d2          # ex: {'.json': target}
+            elif key == 4:        # 4: custom types
+                for _, _, d3 in d2:
+                    yield from self._each_targets(d3)
+            elif key != 0:        # 0: backtrack mark
+                yield from self._each_targets(d2)
+
+    def _has_path_edge(self, d):
+        if 3 in d:                # 3: path
+            return True
+        for key, d2 in d.items():
+            if key == 4:
+                if any( self._has_path_edge(d3) for _, _, d3 in d2 ):
+                    return True
+            elif key is not None and key != 0:
+                if self._has_path_edge(d2):
+                    return True
+        return False
+
+    def _mark_backtrack(self, d):
+        ## marks subtrees which have a state where a segment can be accepted
+        ## by two or more edges, with key 0; failure in other subtrees is final.
+        flag = self._edges_overlap(d)
+        for key, d2 in d.items():
+            if key is None:
+                continue
+            if key == 4:      # 4: custom types
+                for _, _, d3 in d2:
+                    flag = self._mark_backtrack(d3) or flag
+            else:
+                flag = self._mark_backtrack(d2) or flag
+        if flag:
+            d[0] = True       # 0: backtrack mark
+        return flag
 
     def _register(self, path_pat, handler_class, handler_methods):
         assert path_pat.startswith('/') or not path, "** path_pat=%r" % (path_pat,)
@@ -844,32 +2260,51 @@ class StateMachineRouter(Router):
                 pnames.append(pname)
                 if ptype is None:
                     ptype = self._guess_ptype(pname)   # 'int' if 'id' or 'xxx_id'
-                if ptype not in param_types:
-                    raise RouterError("%s: unknown parameter type %r." % (path_pat, ptype))
-                key = param_types[ptype]               # ex: 1 (int) or 2 (str)
+                if ptype in param_types:
+                    key = param_types[ptype]           # ex: 1 (int) or 2 (str)
+                else:
+                    d = self._custom_child(d, path_pat, ptype)
+                    continue
             else:
                 key = item                             # ex: "users"
             if key not in d:
                 d[key] = {}
             d = d[key]
         #
-        if None in d:
+        targets = d.setdefault(None, {})   # None: {suffix: target}
+        t = targets.get(suffix)
+        if t is not None:
             raise RouterError("%s: duplicated urlpath in %s and %s." %
-                              (path_pat, d[None][0].__name__, handler_class.__name__))
-        d[None] = (handler_class, handler_methods, pnames, suffix)
-
+                              (path_pat, t[0].__name__, handler_class.__name__))
+        targets[suffix] = (handler_class, handler_methods, pnames, suffix)
+
+    def _custom_child(self, d, path_pat, ptype):
+        parser = self.URLPATH_PARAM_PARSERS.get(ptype)
+        if parser is None:
+            raise RouterError("%s: unknown parameter type %r." % (path_pat, ptype))
+        entries = d.setdefault(4, [])   # 4: custom types
+        for ptype_, _, d2 in entries:
+            if ptype_ == ptype:
+                return d2
+        d2 = {}
+        entries.append((ptype, parser, d2))  # ex: ('uuid', parser, {})
+        return d2
 
     def find(self, req_path):
         tupl = self._mapping_dict.get(req_path)
         if tupl:
             return tupl  # ex: (BooksAPI, {'GET':do_index, 'POST':do_create}, [])
         #
-        path, suffix = splitext(req_path)
+        path, suffix = _split_suffix(req_path)
+        suffixes = self._suffixes
+        if suffixes is not None and suffix not in suffixes:
+            return None   # no route accepts the suffix
         items = path.split('/')
         if path.startswith('/'):
             items.pop(0)
         #
         d = self._transition
+        int_values = self.SEGMENT_CLASSIFIER.int_values   # cache of hot segments
         param_args = []
         i = -1
         for item in items:
@@ -881,15 +2316,26 @@ class StateMachineRouter(Router):
             #
             d2 = d.get(1)                 # 1: int
             if d2 is not None:
-                try:
-                    intval = int(item)
-                except ValueError:
-                    pass
+                intval = int_values.get(item)
+                if intval is None:
+                    intval = self.SEGMENT_CLASSIFIER.int_value(item)
+                if intval >= 0:
+                    param_args.append(intval)
+                    d = d2
+                    continue
+            #
+            entries = d.get(4)            # 4: custom types
+            if entries is not None:
+                for _, parser, d2 in entries:
+                    val = parser(item)
+                    if val is not None:
+                        break
                 else:
-                    if intval >= 0:
-                        param_args.append(intval)
-                        d = d2
-                        continue
+                    d2 = None
+                if d2 is not None:
+                    param_args.append(val)
+                    d = d2
+                    continue
             #
             d2 = d.get(2)                 # 2: str
             if d2 is not None:
@@ -905,17 +2351,1222 @@ class StateMachineRouter(Router):
                 d = d2
                 break
             #
-            return None
+            return self._backtrack(req_path) if self._backtracking else None
         #
-        t = d.get(None)
-        if t is None:
+        targets = d.get(None)
+        if targets is not None:
+            t = targets.get(suffix) or targets.get('.*')
+            if t is not None:
+                return t[0], t[1], param_args
+        return self._backtrack(req_path) if self._backtracking else None
+
+    def _backtrack(self, req_path):
+        ## called when greedy lookup failed (see TrieRouter._backtrack())
+        path, suffix = _split_suffix(req_path)
+        items = path.split('/')
+        if path.startswith('/'):
+            items.pop(0)
+        return self._search(self._transition, items, 0, suffix, [], True)
+
+    def _search(self, d, items, i, suffix, param_args, greedy):
+        if i == len(items):
+            return self._accept(d.get(None), suffix, param_args)
+        item = items[i]
+        for d2, args in self._accepting_edges(d, item):
+            if greedy and 0 not in d2:   # greedy lookup has already failed
+                greedy = False
+                continue
+            t = self._search(d2, items, i+1, suffix, param_args + args, greedy)
+            if t is not None:
+                return t
+            greedy = False
+        d2 = d.get(3)                 # 3: path
+        if d2 is not None:
+            args = ["/".join(items[i:]) + suffix]
+            return self._accept(d2.get(None), "", param_args + args)
+        return None
+
+
+class CompactStateMachineRouter(StateMachineRouter):
+    """State machine based router (compact; states are integer)"""
+
+    def __init__(self, mapping):
+        StateMachineRouter.__init__(self, mapping)
+        self._compact(self._transition)
+        if not self._backtracking:   # dicts are kept only for backtracking
+            self._transition = None
+
+    def _compact(self, root):
+        static   = {}            # {segment: (state, state) or {state: state}}
+        int_next = array('i')    # state -> state (or -1)
+        str_next = array('i')    # state -> state (or -1)
+        pathnext = array('i')    # state -> state (or -1)
+        custom   = {}            # {state: [(ptype, parser, state)]}
+        targets  = []            # state -> {suffix: target} (or None)
+        intern = sys.intern
+        dicts = [root]           # state -> dict
+        for state, d in enumerate(dicts):    # 'dicts' grows while iterating
+            int_next.append(-1); str_next.append(-1); pathnext.append(-1)
+            targets.append(d.get(None))
+            for key, d2 in d.items():
+                if key is None or key == 0:   # 0: backtrack mark
+                    continue
+                if key == 4:     # 4: custom types
+                    custom[state] = [ (ptype, parser, self._add_state(dicts, d3))
+                                          for ptype, parser, d3 in d2 ]
+                    continue
+                state2 = self._add_state(dicts, d2)
+                if isinstance(key, str):
+                    self._add_static(static, intern(key), state, state2)
+                elif key == 1:   # 1: int
+                    int_next[state] = state2
+                elif key == 2:   # 2: str
+                    str_next[state] = state2
+                elif key == 3:   # 3: path
+                    pathnext[state] = state2
+                else:
+                    assert False, "** internal error: key=%r" % (key,)
+        self._static   = static
+        self._int_next = int_next
+        self._str_next = str_next
+        self._pathnext = pathnext
+        self._custom   = custom
+        self._targets  = targets
+
+    def _add_state(self, dicts, d):
+        dicts.append(d)
+        return len(dicts) - 1
+
+    def _add_static(self, static, segment, state, state2):
+        ## most of segments appear only once in a table, therefore
+        ## use a pair instead of dict for such segment to save memory.
+        entry = static.get(segment)
+        if entry is None:
+            static[segment] = (state, state2)
+        elif entry.__class__ is tuple:
+            static[segment] = {entry[0]: entry[1], state: state2}
+        else:
+            entry[state] = state2
+
+    def find(self, req_path):
+        tupl = self._mapping_dict.get(req_path)
+        if tupl:
+            return tupl  # ex: (BooksAPI, {'GET':do_index, 'POST':do_create}, [])
+        #
+        path, suffix = _split_suffix(req_path)
+        suffixes = self._suffixes
+        if suffixes is not None and suffix not in suffixes:
+            return None   # no route accepts the suffix
+        items = path.split('/')
+        if path.startswith('/'):
+            items.pop(0)
+        #
+        static_get = self._static.get
+        int_next = self._int_next
+        int_values = self.SEGMENT_CLASSIFIER.int_values   # cache of hot segments
+        custom = self._custom
+        state = 0
+        param_args = []
+        i = -1
+        for item in items:
+            i += 1
+            entry = static_get(item)
+            if entry is not None:
+                if entry.__class__ is tuple:     # ex: (state, next_state)
+                    if entry[0] == state:
+                        state = entry[1]
+                        continue
+                else:                            # ex: {state: next_state}
+                    state2 = entry.get(state)
+                    if state2 is not None:
+                        state = state2
+                        continue
+            #
+            state2 = int_next[state]
+            if state2 >= 0:
+                intval = int_values.get(item)
+                if intval is None:
+                    intval = self.SEGMENT_CLASSIFIER.int_value(item)
+                if intval >= 0:
+                    param_args.append(intval)
+                    state = state2
+                    continue
+            #
+            if custom:
+                for _, parser, state2 in custom.get(state, ()):
+                    val = parser(item)
+                    if val is not None:
+                        param_args.append(val)
+                        break
+                else:
+                    state2 = -1
+                if state2 >= 0:
+                    state = state2
+                    continue
+            #
+            state2 = self._str_next[state]
+            if state2 >= 0 and item:
+                param_args.append(item)
+                state = state2
+                continue
+            #
+            state2 = self._pathnext[state]
+            if state2 >= 0:
+                param_args.append("/".join(items[i:]) + suffix)
+                suffix = ""
+                state = state2
+                break
+            #
+            return self._backtrack(req_path) if self._backtracking else None
+        #
+        targets = self._targets[state]
+        if targets is not None:
+            t = targets.get(suffix) or targets.get('.*')
+            if t is not None:
+                return t[0], t[1], param_args
+        return self._backtrack(req_path) if self._backtracking else None
+
+
+class CompiledRouter(TrieRouter):
+    """Trie-base router compiled into Python code"""
+
+    STATIC_DISPATCH_MIN = 4    # use dict dispatch when static children >= this
+    MAX_INDENT          = 24   # generate sub function when nested deeper than this
+
+    def __init__(self, mapping, dump=None):
+        TrieRouter.__init__(self, mapping)
+        self._consts = {}   # {'_c0': handler_class, '_m0': handler_methods, ...}
+        self._source = self._generate(self._tree_root, self._consts)
+        if dump:
+            out = sys.stderr if dump is True else dump   # file-like object
+            out.write(self._source)
+        self._exec_source(self._compile_source())
+
+    def _compile_source(self):
+        return compile(self._source, "<%s>" % self.__class__.__name__, 'exec')
+
+    def _exec_source(self, code):
+        classifier = self.SEGMENT_CLASSIFIER
+        namespace = {'_mapping_get': self._mapping_dict.get, '_split_suffix': _split_suffix,
+                     '_backtrack': self._backtrack,
+                     '_int_values': classifier.int_values, '_int_value': classifier.int_value}
+        namespace.update(self._consts)
+        exec(code, namespace)
+        self.find = namespace['find']
+
+    def _snapshot_state(self):
+        state = dict(self.__dict__)
+        state.pop('find')    # generated function is not picklable
+        state['_code'] = marshal.dumps(self._compile_source())
+        return state
+
+    def _restore_state(self, state):
+        TrieRouter._restore_state(self, state)
+        self._exec_source(marshal.loads(self.__dict__.pop('_code')))
+
+    def _generate(self, root, consts):
+        funcs   = []   # source code of sub functions
+        tables  = []   # source code of dispatch tables
+        targets = []   # handler classes and handler methods
+        ctx = (funcs, tables, targets, consts)
+        ## generated code is greedy as well as 'TrieRouter.find()', therefore
+        ## falls back to '_backtrack()' when edges overlap in the trie
+        fname = "_greedy_find" if self._backtracking else "find"
+        sb = [
+            "def %s(req_path):\n" % fname,
+            "    t = _mapping_get(req_path)\n",
+            "    if t:\n",
+            "        return t\n",
+            "    path, suffix = _split_suffix(req_path)\n",
+        ]
+        if self._suffixes is not None:
+            consts['_suffixes'] = self._suffixes
+            sb.append("    if suffix not in _suffixes:\n")
+            sb.append("        return None\n")
+        sb += [
+            "    items = path.split('/')\n",
+            "    if path.startswith('/'):\n",
+            "        items.pop(0)\n",
+            "    n = len(items)\n",
+        ]
+        self._gen_node(root, 0, 0, 1, sb, ctx)
+        if self._backtracking:
+            sb += [
+                "\n",
+                "def find(req_path):\n",
+                "    return _greedy_find(req_path) or _backtrack(req_path)\n",
+            ]
+        return "".join(funcs + sb + ["\n"] + tables)
+
+    def _gen_node(self, node, depth, nparams, indent, sb, ctx):
+        i = "    " * indent
+        d = depth
+        sb.append("%sif n == %s:\n" % (i, d))
+        if not self._gen_returns(node.targets, nparams, indent+1, sb, ctx):
+            sb.append("%s    return None\n" % i)
+        children = node.children
+        if not children:
+            sb.append("%sreturn None\n" % i)
+            return
+        sb.append("%sx%s = items[%s]\n" % (i, d, d))
+        ## static segments (ex: "users")
+        statics = [ (k, v) for k, v in children.items() if isinstance(k, str) ]
+        if len(statics) >= self.STATIC_DISPATCH_MIN:
+            table = {}
+            for key, child in statics:
+                table[key] = self._gen_func(child, d+1, nparams, ctx)
+            tname = "_d%s" % len(ctx[1])
+            ctx[1].append("%s = {%s}\n" % (tname, ", ".join( "%r: %s" % (k, v)
+                                                            for k, v in table.items() )))
+            sb.append("%sf = %s.get(x%s)\n" % (i, tname, d))
+            sb.append("%sif f is not None:\n" % i)
+            sb.append("%s    return f(%s)\n" % (i, self._gen_args(nparams)))
+        else:
+            for key, child in statics:
+                sb.append("%sif x%s == %r:\n" % (i, d, key))
+                self._gen_child(child, d+1, nparams, indent+1, sb, ctx)
+        ## int parameter
+        child = children.get(1)
+        if child is not None:
+            sb.append("%sp%s = _int_values.get(x%s)\n" % (i, nparams, d))
+            sb.append("%sif p%s is None:\n" % (i, nparams))
+            sb.append("%s    p%s = _int_value(x%s)\n" % (i, nparams, d))
+            sb.append("%sif p%s >= 0:\n" % (i, nparams))
+            self._gen_child(child, d+1, nparams+1, indent+1, sb, ctx)
+        ## custom type parameters
+        for ptype, parser, child in children.get(4, ()):
+            pname = "_t_%s" % ptype
+            ctx[3][pname] = parser
+            sb.append("%sp%s = %s(x%s)\n" % (i, nparams, pname, d))
+            sb.append("%sif p%s is not None:\n" % (i, nparams))
+            self._gen_child(child, d+1, nparams+1, indent+1, sb, ctx)
+        ## str parameter
+        child = children.get(2)
+        if child is not None:
+            sb.append("%sif x%s:\n" % (i, d))
+            sb.append("%s    p%s = x%s\n" % (i, nparams, d))
+            self._gen_child(child, d+1, nparams+1, indent+1, sb, ctx)
+        ## path parameter
+        child = children.get(3)
+        if child is not None and child.targets is not None:
+            target = child.targets.get("") or child.targets.get('.*')
+            if target is not None:
+                sb.append("%sp%s = '/'.join(items[%s:]) + suffix\n" % (i, nparams, d))
+                self._gen_return(target, nparams+1, indent, sb, ctx, False)
+        sb.append("%sreturn None\n" % i)
+
+    def _gen_child(self, child, depth, nparams, indent, sb, ctx):
+        if indent <= self.MAX_INDENT:
+            self._gen_node(child, depth, nparams, indent, sb, ctx)
+        else:
+            fname = self._gen_func(child, depth, nparams, ctx)
+            sb.append("%sreturn %s(%s)\n" % ("    " * indent, fname, self._gen_args(nparams)))
+
+    def _gen_func(self, node, depth, nparams, ctx):
+        funcs = ctx[0]
+        fname = "_f%s" % len(funcs)
+        funcs.append(None)    # reserve index
+        sb = ["def %s(%s):\n" % (fname, self._gen_args(nparams))]
+        self._gen_node(node, depth, nparams, 1, sb, ctx)
+        sb.append("\n")
+        funcs[int(fname[2:])] = "".join(sb)
+        return fname
+
+    def _gen_args(self, nparams):
+        return ", ".join(["items", "n", "suffix"] + [ "p%s" % j for j in range(nparams) ])
+
+    def _gen_returns(self, targets, nparams, indent, sb, ctx):
+        if targets is None:
+            return False
+        ## exact suffixes first, and then wildcard ('.*')
+        for suffix in sorted(targets, key=lambda x: x == '.*'):
+            if self._gen_return(targets[suffix], nparams, indent, sb, ctx):
+                return True
+        return False
+
+    def _gen_return(self, target, nparams, indent, sb, ctx, check_suffix=True):
+        i = "    " * indent
+        handler_class, handler_methods, _, expected_suffix = target
+        targets, consts = ctx[2], ctx[3]
+        k = len(targets)
+        targets.append(target)
+        consts["_c%s" % k] = handler_class
+        consts["_m%s" % k] = handler_methods
+        params = ", ".join( "p%s" % j for j in range(nparams) )
+        if check_suffix and expected_suffix != '.*':
+            sb.append("%sif suffix == %r:\n" % (i, expected_suffix))
+            sb.append("%s    return _c%s, _m%s, [%s]\n" % (i, k, k, params))
+            return False  # returns only when suffix matched
+        sb.append("%sreturn _c%s, _m%s, [%s]\n" % (i, k, k, params))
+        return True       # returns always
+
+    def source(self):
+        return self._source
+
+
+class DFARouter(Router):
+    """Character-level DFA (table-driven)"""
+
+    ## predicates of param types and suffix
+    PREDICATES = {
+        'int'  : re.compile(r'\d').fullmatch,     # '\d+'
+        'str'  : re.compile(r'[^./]').fullmatch,  # '[^./]+'
+        'path' : re.compile(r'.').fullmatch,      # '.*'
+        'word' : re.compile(r'\w').fullmatch,     # '\w+' (for suffix '.*')
+    }
+
+    ## char classes for chars not appeared in urlpath patterns
+    GENERIC_CLASSES = (
+        ('digit'  , {'int', 'str', 'path', 'word'}),
+        ('word'   , {'str', 'path', 'word'}),
+        ('newline', {'str'}),
+        ('other'  , {'str', 'path'}),
+    )
+
+    def __init__(self, mapping):
+        routes = self._init_routes(mapping)
+        self._build_classes(routes)
+        self._build_dfa(routes)
+
+    def _init_routes(self, mapping):
+        self._mapping_dict = {}   # for urlpath having no parameters
+        self._mapping_list = []   # for urlpath having any parameters
+        routes = []
+        for tupl in self._traverse(mapping):
+            path_pat, handler_class, handler_methods = tupl
+            if '{' not in path_pat:
+                self._mapping_dict[path_pat] = (handler_class, handler_methods, _NO_PARAMS)
+            else:
+                path_rexp, param_names, param_funcs = self._compile(path_pat)
+                slice_, sep, has_suffix = self._slice(path_pat)
+                t = (path_pat, path_rexp, handler_class, handler_methods,
+                     param_names, param_funcs, slice_, sep, has_suffix)
+                self._mapping_list.append(t)
+                routes.append(self._nfa_items(path_pat))
+        return routes
+
+    def _nfa_items(self, path_pat):
+        ## ex: '/books/{id:int}.*' -> ['/', 'b', ..., '/', ('int', '+'), ('suffix',)]
+        has_suffix = path_pat.endswith('.*')
+        if has_suffix:
+            path_pat = path_pat[:-2]
+        items = []
+        for text, pname, ptype, _, _ in self._scan(path_pat):
+            items.extend(text)
+            if not pname:
+                continue
+            if ptype == 'path':
+                items.append(('path', '*'))
+            elif ptype in ('int', 'str'):
+                items.append((ptype, '+'))
+            else:
+                raise RouterError("%s: param type '%s' is not supported by %s." %
+                                  (path_pat, ptype, self.__class__.__name__))
+        if has_suffix:
+            items.append(('suffix',))
+        return items
+
+    def _build_classes(self, routes):
+        chars = {'/', '.'}   # chars appeared in urlpath patterns
+        for items in routes:
+            chars.update( x for x in items if isinstance(x, str) )
+        predicates = self.PREDICATES
+        members = []         # list of predicate names per char class
+        char_class = {}      # {char: class}
+        for ch in sorted(chars):
+            char_class[ch] = len(members)
+            members.append({ k for k, f in predicates.items() if f(ch) })
+        generic = {}         # {'digit': class, 'word': class, ...}
+        for name, preds in self.GENERIC_CLASSES:
+            generic[name] = len(members)
+            members.append(preds)
+        if len(members) > 255:
+            raise RouterError("too many kinds of chars in urlpath patterns.")
+        self._char_class = char_class
+        self._generic    = generic
+        self._members    = members
+        self._nclasses   = len(members)
+        ## translation table for ascii chars
+        self._ascii_table = bytes( self._classify_char(chr(i)) for i in range(128) ) + bytes(128)
+
+    def _classify_char(self, ch):
+        c = self._char_class.get(ch)
+        if c is not None:
+            return c
+        generic = self._generic
+        if ch.isdecimal():
+            return generic['digit']
+        if ch.isalnum() or ch == '_':
+            return generic['word']
+        if ch == '\n':
+            return generic['newline']
+        return generic['other']
+
+    def _build_nfa(self, routes):
+        ## node 0 is the start node; edge label is class (int) or predicate name (str)
+        edges   = [[]]   # [[(label, node)]]
+        epsilon = [[]]   # [[node]]
+        accepts = [None] # route index
+        def new_node():
+            edges.append([]); epsilon.append([]); accepts.append(None)
+            return len(edges) - 1
+        char_class = self._char_class
+        for idx, items in enumerate(routes):
+            cur = 0
+            for item in items:
+                if isinstance(item, str):       # literal char
+                    node = new_node()
+                    edges[cur].append((char_class[item], node))
+                elif item[0] == 'suffix':       # '(?:\.\w+)?'
+                    node1, node2, node = new_node(), new_node(), new_node()
+                    edges[cur].append((char_class['.'], node1))
+                    edges[node1].append(('word', node2))
+                    edges[node2].append(('word', node2))
+                    epsilon[node2].append(node)
+                    epsilon[cur].append(node)
+                elif item[1] == '+':            # '\d+' or '[^./]+'
+                    node = new_node()
+                    edges[cur].append((item[0], node))
+                    edges[node].append((item[0], node))
+                else:                           # '.*'
+                    node = new_node()
+                    epsilon[cur].append(node)
+                    edges[node].append((item[0], node))
+                cur = node
+            accepts[cur] = idx
+        return edges, epsilon, accepts
+
+    def _build_dfa(self, routes):
+        edges, epsilon, accepts = self._build_nfa(routes)
+        nclasses = self._nclasses
+        label_classes = {}   # {label: [class]}
+        for c, preds in enumerate(self._members):
+            label_classes[c] = [c]
+            for name in preds:
+                label_classes.setdefault(name, []).append(c)
+        def closure(nodes):
+            stack = list(nodes); result = set(nodes)
+            while stack:
+                for node in epsilon[stack.pop()]:
+                    if node not in result:
+                        result.add(node); stack.append(node)
+            return frozenset(result)
+        start = closure([0])
+        states = {start: 0}  # {frozenset of nfa nodes: dfa state}
+        queue  = [start]
+        transition = []      # flat table; value is offset of next state (or -1)
+        accept = []          # route index per state (or -1)
+        i = 0
+        while i < len(queue):
+            nodes = queue[i]; i += 1
+            moves = [ set() for _ in range(nclasses) ]
+            for node in nodes:
+                for label, node2 in edges[node]:
+                    for c in label_classes.get(label, ()):
+                        moves[c].add(node2)
+            row = []
+            for targets in moves:
+                if not targets:
+                    row.append(-1)
+                    continue
+                nodes2 = closure(targets)
+                state = states.get(nodes2)
+                if state is None:
+                    state = states[nodes2] = len(queue)
+                    queue.append(nodes2)
+                row.append(state * nclasses)
+            transition.extend(row)
+            idxs = [ accepts[node] for node in nodes if accepts[node] is not None ]
+            accept.append(min(idxs) if idxs else -1)   # first-declared route wins
+        self._transition = array('i', transition)
+        self._accept     = array('i', accept)
+
+    ## binary layout of shared tables:
+    ##   header (64 bytes), ascii table (256 bytes), transition (int32 * n), accept (int32 * n)
+    SHARED_MAGIC  = b"MKDFA001"
+    SHARED_HEADER = struct.Struct('=8s40sIII')  # magic, fingerprint, nclasses, nstates, ntransition
+    SHARED_OFFSET = 64 + 256
+
+    def save_shared_tables(self, filename, mapping):
+        """saves DFA tables into file in flat binary layout, so that worker processes
+        can share them by 'attach_shared_tables()' without copy (ex: '/dev/shm/routes.dfa')."""
+        header = self.SHARED_HEADER.pack(self.SHARED_MAGIC,
+                                         self._fingerprint(mapping).encode('ascii'),
+                                         self._nclasses, len(self._accept), len(self._transition))
+        tmpfile = "%s.%s.tmp" % (filename, os.getpid())
+        with open(tmpfile, 'wb') as f:
+            f.write(header.ljust(self.SHARED_OFFSET - 256, b"\0"))
+            f.write(self._ascii_table)
+            f.write(self._transition.tobytes())
+            f.write(self._accept.tobytes())
+        os.replace(tmpfile, filename)   # atomic, even if other workers are attaching
+
+    @classmethod
+    def attach_shared_tables(cls, filename, mapping):
+        """returns router object which refers DFA tables in file via read-only mmap,
+        or None when file not found or stale. handler classes are resolved by route
+        index, therefore 'mapping' should be the same as passed to master's router."""
+        try:
+            with open(filename, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
             return None
-        handler_class, handler_methods, param_names, expected_suffix = t
-        if not self._is_valid_suffix(suffix, expected_suffix):
+        except ValueError:       # empty file can't be mapped
             return None
+        try:
+            router = cls._attach_buffer(buf, mapping)
+        except (struct.error, ValueError, TypeError):   # truncated or broken file
+            router = None
+        if router is None:
+            buf.close()
+        return router
+
+    @classmethod
+    def _attach_buffer(cls, buf, mapping):
+        router = cls.__new__(cls)
+        magic, fingerprint, nclasses, nstates, ntransition = cls.SHARED_HEADER.unpack_from(buf)
+        if magic != cls.SHARED_MAGIC or fingerprint != router._fingerprint(mapping).encode('ascii'):
+            return None
+        offset = cls.SHARED_OFFSET
+        if len(buf) < offset + 4*(ntransition + nstates):
+            return None
+        routes = router._init_routes(mapping)   # no need to build DFA
+        router._build_classes(routes)
+        if router._nclasses != nclasses or router._ascii_table != buf[offset-256:offset]:
+            return None
+        mv = memoryview(buf)
+        router._transition = mv[offset:offset + 4*ntransition].cast('i')
+        offset += 4*ntransition
+        router._accept = mv[offset:offset + 4*nstates].cast('i')
+        router._shared_buf = buf
+        return router
+
+    def _snapshot_state(self):
+        state = dict(self.__dict__)
+        if state.pop('_shared_buf', None) is not None:   # memoryview is not picklable
+            state['_transition'] = array('i', self._transition)
+            state['_accept']     = array('i', self._accept)
+        return state
+
+    def _classify(self, req_path):
+        if req_path.isascii():
+            return req_path.encode('ascii').translate(self._ascii_table)
+        return [ self._classify_char(ch) for ch in req_path ]
+
+    def find(self, req_path):
+        tupl = self._mapping_dict.get(req_path)
+        if tupl:
+            return tupl  # ex: (BooksAPI, {'GET':do_index, 'POST':do_create}, [])
+        #
+        if req_path.isascii():
+            classes = req_path.encode('ascii').translate(self._ascii_table)
+        else:
+            classes = self._classify(req_path)
+        table = self._transition
+        state = 0
+        for c in classes:
+            state = table[state + c]
+            if state < 0:
+                return None
+        idx = self._accept[state // self._nclasses]
+        if idx < 0:
+            return None
+        #
+        (_, path_rexp, handler_class, handler_methods,
+         _, param_funcs, slice_, sep, has_suffix) = self._mapping_list[idx]
+        if slice_:
+            param_args = self._slice_params(req_path, slice_, sep, has_suffix, param_funcs)
+        else:
+            m = path_rexp.match(req_path)
+            param_args = [ (fn(s) if fn else s)
+                               for s, fn in zip(m.groups(), param_funcs) ]
         return handler_class, handler_methods, param_args
 
 
+class AutoRouter(Router):
+    """Router which benchmarks candidates and delegates to the fastest one"""
+
+    CANDIDATES = (
+        HashedLinearRouter,
+        OptimizedRegexpRouter, SlicedRegexpRouter, HashedRegexpRouter,
+        TrieRouter, RadixTrieRouter, StateMachineRouter, CompiledRouter,
+        DFARouter,
+    )
+
+    SAMPLE_PARAMS = {'int': "123", 'str': "abc", 'path': "abc/xyz"}
+
+    def __init__(self, mapping, sample_paths=None, candidates=None, loop=10000):
+        if not isinstance(mapping, RouteTable):
+            mapping = RouteTable(mapping)  # traverses and compiles only once for all candidates
+        if sample_paths is None:
+            sample_paths = self._sample_paths(mapping)
+        if not sample_paths:
+            raise RouterError("AutoRouter: no sample paths.")
+        self._results = []     # [(router_class, build_sec, lookup_sec, error), ...]
+        best = None; best_sec = None; expected = None
+        for klass in (candidates or self.CANDIDATES):
+            start = time.perf_counter()
+            try:
+                router = klass(mapping)
+            except RouterError as ex:
+                self._results.append((klass, None, None, str(ex)))
+                continue
+            build_sec = time.perf_counter() - start
+            try:
+                actual = [ router.lookup('GET', path) for path in sample_paths ]
+            except Exception as ex:
+                error = "%s: %s" % (ex.__class__.__name__, ex)
+                self._results.append((klass, build_sec, None, error))
+                continue
+            if expected is None:
+                expected, expected_class = actual, klass
+            elif actual != expected:
+                error = "result differs from %s." % expected_class.__name__
+                self._results.append((klass, build_sec, None, error))
+                continue
+            lookup_sec = self._benchmark(router, sample_paths, loop)
+            self._results.append((klass, build_sec, lookup_sec, None))
+            if best is None or lookup_sec < best_sec:
+                best, best_sec = router, lookup_sec
+        if best is None:
+            raise RouterError("AutoRouter: no router available.")
+        self._router = best
+        self.find    = best.find     # delegates without overhead
+        self.lookup  = best.lookup
+        self.find_many   = best.find_many
+        self.lookup_many = best.lookup_many
+
+    def _sample_paths(self, mapping):
+        ## ex: '/books/{id:int}.*' -> '/books/123.json'
+        paths = []
+        for path_pat, _, _ in self._traverse(mapping):
+            sb = []
+            if path_pat.endswith('.*'):
+                path_pat = path_pat[:-2] + ".json"
+            for text, pname, ptype, _, _ in self._scan(path_pat):
+                sb.append(text)
+                if pname:
+                    sb.append(self.SAMPLE_PARAMS.get(ptype, pname))
+            paths.append("".join(sb))
+        return paths
+
+    def _benchmark(self, router, sample_paths, loop):
+        lookup = router.lookup
+        n = max(1, loop // len(sample_paths))
+        start = time.perf_counter()
+        for _ in range(n):
+            for path in sample_paths:
+                lookup('GET', path)
+        return (time.perf_counter() - start) / (n * len(sample_paths))
+
+    def _snapshot_state(self):
+        return {'_router': self._router, '_results': self._results}
+
+    def _restore_state(self, state):
+        Router._restore_state(self, state)
+        self.find   = self._router.find
+        self.lookup = self._router.lookup
+        self.find_many   = self._router.find_many
+        self.lookup_many = self._router.lookup_many
+
+    def chosen_router(self):
+        return self._router
+
+    def report(self):
+        """returns text which describes why the router is chosen."""
+        chosen = self._router.__class__
+        sb = ["AutoRouter: chose %s (the fastest lookup)\n" % chosen.__name__]
+        for klass, build_sec, lookup_sec, error in self._results:
+            mark = "*" if klass is chosen else " "
+            if lookup_sec is not None:
+                sb.append("%s %-24s: %8.3f usec/lookup  (build: %.3f sec)\n" %
+                          (mark, klass.__name__, lookup_sec * 1000000, build_sec))
+            else:
+                sb.append("%s %-24s: skipped: %s\n" % (mark, klass.__name__, error))
+        return "".join(sb)
+
+
+class CachedRouter(Router):
+    """Router wrapper which caches results in LRU"""
+
+    def __init__(self, router, cache_size=1000):
+        if cache_size < 1:
+            raise RouterError("cache_size=%r: should be positive integer." % (cache_size,))
+        self._router     = router
+        self._cache_size = cache_size
+        self._cache      = OrderedDict()  # {req_path or (req_meth, req_path): tuple}
+        self._hits       = 0
+        self._misses     = 0
+        self._evictions  = 0
+
+    def find(self, req_path):
+        cache = self._cache
+        t = cache.get(req_path)
+        if t is not None:
+            self._touch(req_path)
+            handler_class, handler_methods, param_args = t
+            return handler_class, handler_methods, list(param_args)  # copy it
+        self._misses += 1
+        t = self._router.find(req_path)
+        ## caches only urlpath having parameters (because static urlpath is
+        ## already found in a dict) and never caches None (because scanners
+        ## will request unlimited number of urlpaths which don't exist)
+        if t is not None and t[2]:
+            handler_class, handler_methods, param_args = t
+            self._store(req_path, (handler_class, handler_methods, tuple(param_args)))
+        return t
+
+    def _find_each(self, req_paths):
+        ## returns cached results, and resolves the rest by 'find_many()'
+        cache = self._cache
+        results = []
+        misses = []
+        for i, req_path in enumerate(req_paths):
+            t = cache.get(req_path)
+            if t is not None:
+                self._touch(req_path)
+                handler_class, handler_methods, param_args = t
+                t = (handler_class, handler_methods, list(param_args))  # copy it
+            else:
+                misses.append(i)
+            results.append(t)
+        if misses:
+            self._misses += len(misses)
+            tuples = self._router.find_many([ req_paths[i] for i in misses ])
+            for i, t in zip(misses, tuples):
+                results[i] = t
+                if t is not None and t[2]:
+                    handler_class, handler_methods, param_args = t
+                    self._store(req_paths[i], (handler_class, handler_methods, tuple(param_args)))
+        return results
+
+    def lookup(self, req_meth, req_path):
+        key = (req_meth, req_path)
+        t = self._cache.get(key)
+        if t is not None:
+            self._touch(key)
+            handler_class, handler_func, param_args = t
+            return handler_class, handler_func, list(param_args)  # copy it
+        self._misses += 1
+        handler_class, handler_func, param_args = \
+            self._router.lookup(req_meth, req_path)
+        if param_args:
+            self._store(key, (handler_class, handler_func, tuple(param_args)))
+        return handler_class, handler_func, param_args
+
+    def _touch(self, key):
+        self._hits += 1
+        try:
+            self._cache.move_to_end(key)
+        except KeyError:   # evicted by other thread
+            pass
+
+    def _store(self, key, tupl):
+        cache = self._cache
+        cache[key] = tupl
+        while len(cache) > self._cache_size:
+            try:
+                cache.popitem(last=False)
+            except KeyError:   # cleared by other thread
+                break
+            self._evictions += 1
+
+    def cache_info(self):
+        return {"hits": self._hits, "misses": self._misses,
+                "evictions": self._evictions,
+                "size": len(self._cache), "maxsize": self._cache_size}
+
+    def cache_clear(self):
+        self._cache.clear()
+        self._hits = self._misses = self._evictions = 0
+
+
+class RejectFilterRouter(Router):
+    """Router wrapper which rejects obvious not-found urlpaths (such as
+    requests from vulnerability scanners) by a few hash probes"""
+
+    def __init__(self, router, mapping):
+        self._router   = router
+        self._heads    = {}    # {first segment: {second segment}} (None means any)
+        self._counts   = set() # number of '/' in urlpath
+        self._min_open = sys.maxsize   # for urlpath having 'path' param
+        self._rejected = 0
+        self._passed   = 0
+        self._static_get = getattr(router, '_mapping_dict', {}).get
+        for path_pat, _, _ in self._traverse(mapping):
+            self._add_pattern(path_pat)
+
+    def _add_pattern(self, path_pat):
+        ## ex: '/api/{id:int}/comments' -> ['', 'api', None, 'comments']
+        opened = False
+        suffix = '{' in path_pat and path_pat.endswith('.*')
+        if suffix:
+            path_pat = path_pat[:-2]
+        segs = [[]]
+        for text, pname, ptype, _, _ in self._router._scan(path_pat):
+            for i, piece in enumerate(text.split('/')):
+                if i:
+                    segs.append([])
+                segs[-1].append(piece)
+            if pname:
+                segs[-1].append(None)      # any string except '/'
+                if ptype not in ('int', 'str'):
+                    opened = True          # 'path' or custom param may contain '/'
+                    break
+        values = [ (None if None in parts else "".join(parts)) for parts in segs ]
+        if suffix and not opened:
+            values[-1] = None              # ex: '123' or '123.json'
+        pad = None if opened else ""
+        v0, v1, v2 = (values + [pad, pad])[:3]
+        if opened:
+            self._min_open = min(self._min_open, path_pat.count('/'))
+        else:
+            self._counts.add(path_pat.count('/'))
+        if v0 != "":
+            self._heads = None             # can't filter by segment
+        if self._heads is not None:
+            self._heads.setdefault(v1, set()).add(v2)
+
+    def _may_exist(self, req_path):
+        n = req_path.count('/')
+        if n not in self._counts and n < self._min_open:
+            return False
+        heads = self._heads
+        if heads is None:
+            return True
+        parts = req_path.split('/', 3)
+        if parts[0]:
+            return False
+        seg1 = parts[1] if len(parts) > 1 else ""
+        seg2 = parts[2] if len(parts) > 2 else ""
+        for seconds in (heads.get(seg1), heads.get(None)):
+            if seconds is not None and (seg2 in seconds or None in seconds):
+                return True
+        return False
+
+    def find(self, req_path):
+        ## same as '_may_exist()' but inlined for performance
+        tupl = self._static_get(req_path)
+        if tupl:
+            self._passed += 1
+            return tupl
+        n = req_path.count('/')
+        if n in self._counts or n >= self._min_open:
+            heads = self._heads
+            if heads is None:
+                self._passed += 1
+                return self._router.find(req_path)
+            parts = req_path.split('/', 3)
+            if not parts[0]:
+                seg1 = parts[1] if len(parts) > 1 else ""
+                seg2 = parts[2] if len(parts) > 2 else ""
+                seconds = heads.get(seg1)
+                if seconds is not None and (seg2 in seconds or None in seconds):
+                    self._passed += 1
+                    return self._router.find(req_path)
+                seconds = heads.get(None)
+                if seconds is not None and (seg2 in seconds or None in seconds):
+                    self._passed += 1
+                    return self._router.find(req_path)
+        self._rejected += 1
+        return None
+
+    def _find_each(self, req_paths):
+        may_exist = self._may_exist
+        indices = [ i for i, p in enumerate(req_paths) if may_exist(p) ]
+        self._rejected += len(req_paths) - len(indices)
+        self._passed   += len(indices)
+        results = [None] * len(req_paths)
+        tuples = self._router.find_many([ req_paths[i] for i in indices ])
+        for i, t in zip(indices, tuples):
+            results[i] = t
+        return results
+
+    def filter_info(self):
+        return {"rejected": self._rejected, "passed": self._passed}
+
+
+class BatchClassifier(object):
+    """Classifies many urlpaths into route indices at once by NumPy
+    (for offline analytics such as access logs; requires NumPy)"""
+
+    MAX_INT_DIGITS = 18   # any 18-digits number fits in int64
+
+    def __init__(self, router, mapping, max_width=256, chunk_size=65536):
+        if np is None:
+            raise RouterError("BatchClassifier: requires NumPy.")
+        self._router     = router     # resolves undecidable urlpaths by find()
+        self._max_width  = max_width  # longer urlpaths are resolved by find()
+        self._chunk_size = chunk_size
+        self.routes      = []         # [(urlpath_pattern, handler_class, handler_methods)]
+        self._route_index = {}        # {(handler_class, methods): [(route index, urlpath pattern, rexp)]}
+        statics = []
+        others  = []
+        for index, tupl in enumerate(Router()._traverse(mapping)):
+            path_pat, handler_class, handler_methods = tupl
+            self.routes.append(tupl)
+            key = (handler_class, frozenset(handler_methods.items()))
+            rexp = None if '{' not in path_pat else router._compile(path_pat)[0]
+            self._route_index.setdefault(key, []).append((index, path_pat, rexp))
+            if '{' not in path_pat:
+                statics.append((index, [path_pat], False, True))
+            else:
+                others.append((index,) + self._parse(path_pat))
+        ## static urlpaths have priority over others (as well as routers)
+        rules = statics + others
+        texts = [ t[1][0] for t in rules if isinstance(t[1][0], str) ]
+        self._hashkey_len = min(8, min(map(len, texts))) if texts else 0
+        self._text_maxlen = max( len(tok) for t in rules for tok in t[1]
+                                     if isinstance(tok, str) ) if rules else 0
+        self._rules = [ t + (self._hashkey_of(t[1][0]), self._minlength(t[1]))
+                            for t in rules ]
+
+    def _parse(self, path_pat):
+        ## ex: '/books/{id:int}.*' -> (['/books/', ('int',)], True, True)
+        suffix = path_pat.endswith('.*')
+        if suffix:
+            path_pat = path_pat[:-2]
+        tokens = []
+        for text, pname, ptype, _, _ in self._router._scan(path_pat):
+            if text:
+                tokens.append(text)
+            if pname:
+                tokens.append((ptype,))
+        decidable = all( self._decidable(tok, nxt) for tok, nxt
+                             in zip(tokens, tokens[1:] + [None]) )
+        return tokens, suffix, decidable
+
+    def _decidable(self, token, next_token):
+        ## whether param can be matched without backtracking or not
+        if isinstance(token, str):
+            return True
+        nxt = next_token
+        if nxt is not None and not isinstance(nxt, str):
+            return False
+        ptype = token[0]
+        if ptype == 'int':
+            return nxt is None or not nxt[0].isdigit()
+        if ptype == 'str':
+            return nxt is None or nxt[0] in './'
+        if ptype == 'path':
+            return nxt is None
+        return False   # custom param type
+
+    def _minlength(self, tokens):
+        return sum( len(tok) if isinstance(tok, str) else
+                    0        if tok[0] == 'path' else
+                    1        for tok in tokens )
+
+    def _hashkey_of(self, text):
+        n = self._hashkey_len
+        if not n or not isinstance(text, str):
+            return None          # compares with all urlpaths
+        if max(map(ord, text[:n])) > 127:
+            return -1            # never matches (non-ascii urlpath is not decidable)
+        return int.from_bytes(text[:n].encode('ascii'), 'big')
+
+    def classify(self, req_paths):
+        """returns array of route indices (-1 when not found) and param
+        columns ({route index: (row indices, [param values, ...])})."""
+        req_paths = list(req_paths)
+        route_ids = np.full(len(req_paths), -1, dtype=np.int32)
+        chunks = {}      # {route index: [(rows, columns), ...]}
+        fallbacks = []   # row indices to be resolved by find()
+        size = self._chunk_size
+        for offset in range(0, len(req_paths), size):
+            self._classify_chunk(req_paths[offset:offset+size], offset,
+                                 route_ids, chunks, fallbacks)
+        if fallbacks:
+            self._resolve_fallbacks(req_paths, fallbacks, route_ids, chunks)
+        columns = {}
+        for index, pairs in chunks.items():
+            rows = np.concatenate([ r for r, _ in pairs ])
+            order = np.argsort(rows, kind='stable')
+            ncols = len(pairs[0][1])
+            columns[index] = (rows[order],
+                              [ np.concatenate([ c[j] for _, c in pairs ])[order]
+                                    for j in range(ncols) ])
+        return route_ids, columns
+
+    def _classify_chunk(self, req_paths, offset, route_ids, chunks, fallbacks):
+        n = len(req_paths)
+        lens = np.fromiter(map(len, req_paths), dtype=np.int64, count=n)
+        undecidable = lens > self._max_width
+        joined = "".join(req_paths)
+        if not joined.isascii() or "\0" in joined:
+            undecidable |= np.array([ not p.isascii() or "\0" in p for p in req_paths ])
+        if undecidable.any():
+            req_paths = [ ("" if x else p) for p, x in zip(req_paths, undecidable.tolist()) ]
+            lens[undecidable] = 0
+        status = np.full(n, -1, dtype=np.int32)  # -1: unresolved, -2: fallback
+        status[undecidable] = -2
+        ## fixed-width byte matrix (zero-padded, column-major: M[k, row])
+        arr = np.array(req_paths, dtype='S')
+        width = arr.dtype.itemsize
+        M = np.zeros((width + self._text_maxlen + 2, n), dtype=np.uint8)
+        M[:width] = arr.view(np.uint8).reshape(n, width).T
+        groups = self._group_by_hashkey(M, n)
+        all_rows = np.arange(n)
+        for index, tokens, suffix, decidable, hashkey, minlen in self._rules:
+            rows = all_rows if hashkey is None else groups.get(hashkey)
+            if rows is None:
+                continue
+            rows = rows[(status[rows] == -1) & (lens[rows] >= minlen)]
+            if not len(rows):
+                continue
+            skip = 0 if hashkey is None else self._hashkey_len  # already matched
+            if not decidable:     # rows which may match are resolved by find()
+                if isinstance(tokens[0], str):
+                    rows = rows[self._match_text(M, rows, None, tokens[0], skip)]
+                status[rows] = -2
+                continue
+            rows, spans, toolarge = self._match(M, lens, rows, tokens, suffix, skip)
+            status[toolarge] = -2
+            if not len(rows):
+                continue
+            status[rows] = index
+            columns = [ self._column(M, req_paths, rows, ptype, start, end)
+                            for ptype, start, end in spans ]
+            chunks.setdefault(index, []).append((rows + offset, columns))
+        route_ids[offset:offset+n] = np.where(status >= 0, status, -1)
+        fallbacks.extend((np.flatnonzero(status == -2) + offset).tolist())
+
+    def _group_by_hashkey(self, M, n):
+        ## {prefix hash: row indices}
+        if not self._hashkey_len:
+            return {}
+        keys = np.zeros(n, dtype=np.uint64)
+        for k in range(self._hashkey_len):
+            keys = (keys << np.uint64(8)) | M[k].astype(np.uint64)
+        order = np.argsort(keys, kind='stable')
+        uniq, starts = np.unique(keys[order], return_index=True)
+        ends = starts[1:].tolist() + [n]
+        return { k: order[s:e] for k, s, e in zip(uniq.tolist(), starts.tolist(), ends) }
+
+    def _match_text(self, M, rows, pos, text, skip=0):
+        ## 'pos' is None when text is at the beginning of urlpath
+        ok = np.ones(len(rows), dtype=bool)
+        for k in range(skip, len(text)):
+            c = ord(text[k])
+            if c > 127:
+                ok[:] = False
+                break
+            if pos is None:
+                ok &= M[k][rows] == c
+            else:
+                ok &= M[pos + k, rows] == c
+        return ok
+
+    def _match(self, M, lens, rows, tokens, suffix, skip):
+        pos = None     # means zero
+        spans = []     # [(ptype, start, end)]
+        def select(ok):
+            return (rows[ok], (None if pos is None else pos[ok]),
+                    [ (t, s[ok], e[ok]) for t, s, e in spans ])
+        for token in tokens:
+            if isinstance(token, str):
+                rows, pos, spans = select(self._match_text(M, rows, pos, token, skip))
+                pos = (np.full(len(rows), len(token), dtype=np.int64) if pos is None
+                       else pos + len(token))
+                skip = 0
+                continue
+            if pos is None:
+                pos = np.zeros(len(rows), dtype=np.int64)
+            ptype = token[0]
+            if ptype == 'path':
+                end = lens[rows]
+            else:
+                end = self._scan_end(M, rows, pos, ptype)
+                ok = end > pos
+                rows, pos, spans = select(ok)
+                end = end[ok]
+            spans.append((ptype, pos, end))
+            pos = end
+        ln = lens[rows]
+        if suffix:   # ex: '.json'
+            ok = (pos == ln) | ((M[pos, rows] == 0x2e) & (pos + 1 < ln)
+                                & (self._scan_end(M, rows, pos + 1, 'suffix') >= ln))
+        else:
+            ok = pos == ln
+        rows, pos, spans = select(ok)
+        ## too large int is resolved by find()
+        toolarge = np.zeros(len(rows), dtype=bool)
+        for ptype, start, end in spans:
+            if ptype == 'int':
+                toolarge |= (end - start) > self.MAX_INT_DIGITS
+        toolarge_rows = rows[toolarge]
+        if len(toolarge_rows):
+            rows, pos, spans = select(~toolarge)
+        return rows, spans, toolarge_rows
+
+    def _scan_end(self, M, rows, pos, kind):
+        ## returns next position of char which terminates 'int' param,
+        ## 'str' param or suffix (= non-word char) for each row
+        end = pos.copy()
+        idx = np.arange(len(rows))
+        while len(idx):
+            c = M[end[idx], rows[idx]]
+            if kind == 'int':
+                going = (c >= 0x30) & (c <= 0x39)
+            elif kind == 'str':
+                going = (c != 0x2f) & (c != 0x2e) & (c != 0)
+            else:
+                lower = c | 0x20
+                going = (((c >= 0x30) & (c <= 0x39)) | ((lower >= 0x61) & (lower <= 0x7a))
+                         | (c == 0x5f))
+            idx = idx[going]
+            end[idx] += 1
+        return end
+
+    def _column(self, M, req_paths, rows, ptype, start, end):
+        if ptype == 'int':    # parses digits vectorially
+            val = np.zeros(len(rows), dtype=np.int64)
+            ndigits = end - start
+            limit = M.shape[0] - 1
+            for k in range(int(ndigits.max()) if len(rows) else 0):
+                d = M[np.minimum(start + k, limit), rows].astype(np.int64) - 0x30
+                val = np.where(k < ndigits, val * 10 + d, val)
+            return val
+        return self._object_array([ req_paths[i][s:e] for i, s, e
+                                        in zip(rows.tolist(), start.tolist(), end.tolist()) ])
+
+    def _object_array(self, values):
+        arr = np.empty(len(values), dtype=object)
+        arr[:] = values
+        return arr
+
+    def _resolve_fallbacks(self, req_paths, fallbacks, route_ids, chunks):
+        results = self._router.find_many([ req_paths[i] for i in fallbacks ])
+        found = {}    # {route index: ([row index, ...], [param args, ...])}
+        for i, t in zip(fallbacks, results):
+            if t is None:
+                continue
+            handler_class, handler_methods, param_args = t
+            index = self._route_index_of(req_paths[i], handler_class, handler_methods)
+            if index is None:
+                continue
+            route_ids[i] = index
+            rows, args_list = found.setdefault(index, ([], []))
+            rows.append(i)
+            args_list.append(param_args)
+        for index, (rows, args_list) in found.items():
+            columns = []
+            for values in zip(*args_list):
+                if all( type(v) is int and -2**63 <= v < 2**63 for v in values ):
+                    columns.append(np.array(values, dtype=np.int64))
+                else:
+                    columns.append(self._object_array(list(values)))
+            chunks.setdefault(index, []).append((np.array(rows, dtype=np.int64), columns))
+
+    def _route_index_of(self, req_path, handler_class, handler_methods):
+        ## same handler class can be mounted on several urlpaths
+        key = (handler_class, frozenset(handler_methods.items()))
+        for index, path_pat, rexp in self._route_index.get(key, ()):
+            if (req_path == path_pat if rexp is None else rexp.match(req_path)):
+                return index
+        return None
+
+
 class RequestHandler(object):
 
     def __init__(self, req, resp):
@@ -990,6 +3641,44 @@ HTTP_REQUEST_METHODS = {
 }
 
 
+class HandlerMethods(dict):
+    """dict of request method and handler function (ex: {'GET': do_show}),
+    with method dispatch table resolved in advance."""
+
+    __slots__ = ('dispatch', 'allowed', 'route')
+
+    def __init__(self, actions):
+        dict.__init__(self, actions)
+        self.route = None         # ex: (route_id, '/books/{id:int}', ('id',))
+        fn = actions.get
+        dispatch = MethodDispatch()
+        for meth in HTTP_REQUEST_METHODS | set(actions):
+            dispatch[meth] = fn(meth) or (meth == 'HEAD' and fn('GET')) or fn('ANY') or None
+        self.dispatch = dispatch  # ex: {'GET': do_show, 'HEAD': do_show, 'POST': None, ...}
+        self.allowed  = frozenset( k for k, v in dispatch.items()
+                                       if v is not None and k != 'ANY' )
+
+
+class RouteMatch(namedtuple('RouteMatch', ('route_id', 'pattern', 'handler_class',
+                                            'handler_methods', 'param_names', 'params'))):
+    """immutable result of 'Router.match()'."""
+
+    __slots__ = ()
+
+    def named_params(self):
+        """ex: {'id': 123} (for '/books/{id:int}')"""
+        return dict(zip(self.param_names, self.params))
+
+
+class MethodDispatch(dict):
+    """dispatch table of request method and handler function."""
+
+    __slots__ = ()
+
+    def __missing__(self, req_meth):  # for unknown request method
+        return self.get('ANY')
+
+
 class Request(object):
 
     def __init__(self, env):
@@ -1071,7 +3760,7 @@ class Application(object):
         if isinstance(mapping, Router):
             self._router = mapping
         else:
-            self._router = NaiveLinearRouter(mapping)
+            self._router = NaiveLinearRouter(mapping).build_redirects(mapping)
 
     def __call__(self, env, start_response):
         status, headers, body = self.handle_request(Request(env), Response())
@@ -1110,10 +3799,7 @@ class Application(object):
     def find_redirect_location(self, meth, path):
         if not (meth == 'GET' or meth == 'HEAD'):
             return None
-        location = path[:-1] if path.endswith('/') else path+'/'
-        if self._router.find(location) is None:
-            return None
-        return location
+        return self._router.find_redirect(path)
 
     def http_error(self, status_code, req, resp):
         status_line = HTTP_RESPONSE_STATUS_DICT.get(status_code)
@@ -13,8 +13,8 @@ from minikeight import (
     on, RequestHandler,
     NaiveLinearRouter, PrefixLinearRouter, FixedLinearRouter, HashedLinearRouter,
     NaiveRegexpRouter, SmartRegexpRouter, NestedRegexpRouter,
-    OptimizedRegexpRouter, SlicedRegexpRouter, HashedRegexpRouter,
-    TrieRouter, StateMachineRouter,
+    OptimizedRegexpRouter, SlicedRegexpRouter, HashedRegexpRouter, ShardedRegexpRouter,
+    TrieRouter, StateMachineRouter, RouteTable,
 )
 
 
@@ -30,6 +30,7 @@ router_classes = (
     OptimizedRegexpRouter,
     SlicedRegexpRouter,
     HashedRegexpRouter,
+    ShardedRegexpRouter,
     #
     TrieRouter,
     StateMachineRouter,
@@ -262,22 +263,24 @@ with Benchmarker(loop, width=width, cycle=1, extra=0) as bench:
 
     fast_routers = {
         HashedLinearRouter,
-        NestedRegexpRouter, OptimizedRegexpRouter, SlicedRegexpRouter, HashedRegexpRouter,
+        NestedRegexpRouter, OptimizedRegexpRouter, SlicedRegexpRouter, HashedRegexpRouter, ShardedRegexpRouter,
         TrieRouter, StateMachineRouter,
     }
     faster_routers = {
-        OptimizedRegexpRouter, SlicedRegexpRouter, HashedRegexpRouter,
+        OptimizedRegexpRouter, SlicedRegexpRouter, HashedRegexpRouter, ShardedRegexpRouter,
         TrieRouter, StateMachineRouter,
     }
 
+    route_table = RouteTable(mapping)   # traverses and compiles mapping only once
+
     for router_class in router_classes:
         for urlpath in urlpaths:
             #
             label = router_class.__name__.replace('Router', '')
             if router_class.__name__.startswith("Hashed"):
-                router_obj = router_class(mapping, r'^/api/\w\w')
+                router_obj = router_class(route_table, r'^/api/\w\w')
             else:
-                router_obj = router_class(mapping)
+                router_obj = router_class(route_table)
             #
             if router_class in faster_routers:
                 tag = ("fast", "faster")
@@ -106,6 +106,32 @@ class OrdersAPI(RequestHandler):
             return {"action": "show", "id": id}
 
 
+## for custom param types ('uuid' and 'hex')
+class ItemsAPI(RequestHandler):
+
+    with on.path('/{item_id:uuid}'):
+
+        @on('GET')
+        def do_show(self, item_id):
+            return {"action": "show", "item_id": str(item_id)}
+
+    with on.path('/{name}'):
+
+        @on('GET')
+        def do_search(self, name):
+            return {"action": "search", "name": name}
+
+    with on.path('/{code:hex}/history'):
+
+        @on('GET')
+        def do_history(self, code):
+            return {"action": "history", "code": code}
+
+
+def hex2int(s):
+    return int(s, 16)
+
+
 LIST_MAPPING = [
     (r'/'                  , HomeAPI),
     (r'/api/v1', [
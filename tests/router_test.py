@@ -1,19 +1,27 @@
 # -*- coding: utf-8 -*-
 
-import sys, os
+import sys, os, io, shutil, tempfile, uuid, pickle
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from array import array
 sys.path.append(os.path.dirname(__file__))
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from oktest import ok, test, subject, situation, at_end
+from oktest import ok, test, subject, situation, at_end, skip
 
 from minikeight import (
-    Router,
+    on, RequestHandler, Router, RouterError,
     NaiveLinearRouter, PrefixLinearRouter, FixedLinearRouter, HashedLinearRouter,
     NaiveRegexpRouter, SmartRegexpRouter, NestedRegexpRouter,
-    OptimizedRegexpRouter, SlicedRegexpRouter, HashedRegexpRouter,
-    TrieRouter, StateMachineRouter,
+    OptimizedRegexpRouter, SlicedRegexpRouter, HashedRegexpRouter, ShardedRegexpRouter,
+    TrieRouter, RadixTrieRouter, StateMachineRouter, CompactStateMachineRouter,
+    CachedRouter, CompiledRouter, DFARouter, AutoRouter, BatchClassifier,
+    RejectFilterRouter, RouteMatch, RouteTable, SegmentClassifier,
 )
 from mock_handler import HomeAPI, BooksAPI, BookCommentsAPI, OrdersAPI, LIST_MAPPING, DICT_MAPPING
+from mock_handler import ItemsAPI, hex2int
 
 
 class MockRouter(Router):
@@ -67,6 +75,89 @@ class Router_TestCase(object):
             t = router.lookup("DELETE", "/api/v1/orders/123.html")
             ok (t) == (OrdersAPI, OrdersAPI.do_delete, [123])
 
+        @test("resolves 'HEAD' to 'GET' handler.")
+        def _(self, router):
+            t = router.lookup("HEAD", "/api/v1/books/123.json")
+            ok (t) == (BooksAPI, BooksAPI.do_show, [123])
+            t = router.lookup("POST", "/api/v1/books/123.json")
+            ok (t) == (BooksAPI, None, [123])
+
+
+def _save_param_types():
+    return dict(Router.URLPATH_PARAM_TYPES), dict(Router.URLPATH_PARAM_PARSERS)
+
+def _restore_param_types(saved):
+    ## restores in place, because RouteTable compares identity of dict
+    for d, d_saved in zip((Router.URLPATH_PARAM_TYPES, Router.URLPATH_PARAM_PARSERS), saved):
+        d.clear()
+        d.update(d_saved)
+
+
+class RegisterParamType_TestCase(object):
+
+    ROUTER_CLASSES = (
+        NaiveLinearRouter, PrefixLinearRouter, FixedLinearRouter, HashedLinearRouter,
+        NaiveRegexpRouter, SmartRegexpRouter, NestedRegexpRouter,
+        OptimizedRegexpRouter, SlicedRegexpRouter, HashedRegexpRouter, ShardedRegexpRouter,
+        TrieRouter, RadixTrieRouter, StateMachineRouter, CompactStateMachineRouter,
+        CompiledRouter,
+    )
+
+    def provide_param_types(self):
+        return _save_param_types()
+
+    def release_param_types(self, value):
+        _restore_param_types(value)
+
+    def provide_mapping(self, param_types):
+        Router.register_param_type('uuid', r'[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12}', uuid.UUID)
+        Router.register_param_type('hex', r'[0-9a-f]+', hex2int)
+        return [('/items', ItemsAPI)]
+
+    with subject(".register_param_type()"):
+
+        @test("custom param type is available in all routers.")
+        def _(self, mapping):
+            s = '12345678-1234-1234-1234-123456789abc'
+            for router_class in self.ROUTER_CLASSES:
+                router = router_class(mapping)
+                t = router.lookup('GET', '/items/' + s)
+                ok (t) == (ItemsAPI, ItemsAPI.do_show, [uuid.UUID(s)])
+                t = router.lookup('GET', '/items/foo')
+                ok (t) == (ItemsAPI, ItemsAPI.do_search, ['foo'])
+                t = router.lookup('GET', '/items/ff/history')
+                ok (t) == (ItemsAPI, ItemsAPI.do_history, [255])
+                t = router.lookup('GET', '/items/zz/history')
+                ok (t) == (None, None, None)
+
+        @test("custom param type is kept in snapshot.")
+        def _(self, mapping):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                fname = os.path.join(tmpdir, "router.snapshot")
+                for router_class in (TrieRouter, RadixTrieRouter, StateMachineRouter,
+                                     CompactStateMachineRouter, CompiledRouter):
+                    router_class(mapping).save_snapshot(fname, mapping)
+                    router = router_class.load_snapshot(fname, mapping)
+                    t = router.find('/items/ff/history')
+                    ok (t) == (ItemsAPI, {'GET': ItemsAPI.do_history}, [255])
+
+        @test("raises error when param type is invalid.")
+        def _(self, param_types):
+            def fn(): Router.register_param_type('int', r'[0-9]+', int)
+            ok (fn).raises(RouterError, "int: cannot redefine builtin param type.")
+            def fn(): Router.register_param_type('ymd', r'(\d+)-(\d+)-(\d+)')
+            ok (fn).raises(RouterError, r"(\d+)-(\d+)-(\d+): capturing group is not allowed in param type regexp.")
+
+        @test("raises error when param type is not registered.")
+        def _(self):
+            class FooAPI(RequestHandler):
+                with on.path('/{x:foo}'):
+                    @on('GET')
+                    def do_show(self, x):
+                        pass
+            for router_class in self.ROUTER_CLASSES:
+                ok (lambda: router_class([('/foo', FooAPI)])).raises(RouterError)
+
 
 class Router_TestBase(object):
 
@@ -79,6 +170,12 @@ class Router_TestBase(object):
     def provide_tupletype(self):
         return self.TUPLE_TYPE
 
+    def provide_snapshot_file(self):
+        return os.path.join(tempfile.mkdtemp(), "router.snapshot")
+
+    def release_snapshot_file(self, value):
+        shutil.rmtree(os.path.dirname(value), ignore_errors=True)
+
     def _test_when_found(self, router):
         tupletype = self.TUPLE_TYPE
         c = HomeAPI
@@ -156,6 +253,16 @@ class Router_TestBase(object):
         def _(self, router):
             self._test_suffix_pattern(router)
 
+        @test("returns params of static route which caller cannot corrupt.")
+        def _(self, router):
+            t = router.find('/api/v1/books.json')
+            ok (t[2]) == []
+            try:
+                t[2].append(1)     # raises TypeError if shared with other calls
+            except TypeError:
+                pass
+            ok (router.find('/api/v1/books.json')[2]) == []
+
     with subject("#__init__()"):
 
         @test("accepts dict mapping.")
@@ -163,6 +270,158 @@ class Router_TestBase(object):
             router = self.ROUTER_CLASS(DICT_MAPPING)
             self._test_when_found(router)
 
+    with subject("#lookup()"):
+
+        @test("resolves handler function with method dispatch table.")
+        def _(self, router):
+            c = BooksAPI
+            ok (router.lookup('GET', '/api/v1/books/123.json')) == (c, c.do_show, [123])
+            ok (router.lookup('HEAD', '/api/v1/books/123.json')) == (c, c.do_show, [123])
+            ok (router.lookup('POST', '/api/v1/books/123.json')) == (c, None, [123])
+            ok (router.lookup('GET', '/api/v1/books/abc.json')) == (None, None, None)
+
+    with subject("#match()"):
+
+        @test("returns RouteMatch object which has route info and params tuple.")
+        def _(self, router):
+            c = BookCommentsAPI
+            m = router.match('/api/v1/books/123/comments/abcd')
+            ok (m).is_a(RouteMatch)
+            ok (m.pattern) == '/api/v1/books/{book_id:int}/comments/{code}'
+            ok (m.handler_class) == c
+            ok (m.handler_methods) == {"GET": c.do_show, "PUT": c.do_update, "DELETE": c.do_delete}
+            ok (m.param_names) == ('book_id', 'code')
+            ok (m.params) == (123, 'abcd')
+            ok (m.named_params()) == {'book_id': 123, 'code': 'abcd'}
+            ok (router.match('/api/v1/books/abc.json')) == None
+
+        @test("returns the same object for static urlpath.")
+        def _(self, router):
+            m = router.match('/api/v1/books.json')
+            ok (m.pattern) == '/api/v1/books.json'
+            ok (m.params) == ()
+            ok (router.match('/api/v1/books.json')).is_(m)
+
+        @test("gives unique route id to each route.")
+        def _(self, router):
+            paths = ['/', '/api/v1/books.json', '/api/v1/books/123.json',
+                     '/api/v1/books/123/comments', '/api/v1/books/123/comments/abcd',
+                     '/api/v1/orders/', '/api/v1/orders/123.json']
+            ids = [ router.match(p).route_id for p in paths ]
+            ok (sorted(ids)) == list(range(len(paths)))
+
+        @test("returns the same params as #find() for dynamic urlpath.")
+        def _(self, router):
+            paths = ['/api/v1/books/123.json', '/api/v1/books/123', '/api/v1/books/123.html',
+                     '/api/v1/books/123/comments', '/api/v1/books/123/comments/abcd',
+                     '/api/v1/orders/123.json', '/api/v1/orders/123']
+            for p in paths:
+                t = router.find(p)
+                m = router.match(p)
+                if t is None:
+                    ok (m) == None
+                else:
+                    ok ((m.handler_class, m.handler_methods, list(m.params))) == tuple(t)
+            if type(router)._match_dynamic is not Router._match_dynamic:
+                def find(req_path):
+                    raise AssertionError("find() called from match()")
+                router.find = find
+                ok (router.match('/api/v1/orders/123.json').params) == (123,)
+
+    with subject("#find_redirect()"):
+
+        @test("returns urlpath which has trailing '/' added or removed if found.")
+        def _(self, router):
+            for r in (router, self.ROUTER_CLASS(LIST_MAPPING).build_redirects(LIST_MAPPING)):
+                ok (r.find_redirect('/api/v1/orders')) == '/api/v1/orders/'
+                ok (r.find_redirect('/api/v1/books.json/')) == '/api/v1/books.json'
+                ok (r.find_redirect('/api/v1/books/123/comments/')) == '/api/v1/books/123/comments'
+                ok (r.find_redirect('/api/v1/books/123.json/')) == '/api/v1/books/123.json'
+                ok (r.find_redirect('/api/v1/books/abc.json/')) == None
+                ok (r.find_redirect('/api/v1/books')) == None
+
+        @test("table built by #build_redirects() finds the same location as #find().")
+        def _(self, router):
+            r = self.ROUTER_CLASS(LIST_MAPPING).build_redirects(LIST_MAPPING)
+            paths = ['/api/v1/books/123', '/api/v1/books/123/', '/api/v1/books/123.json/',
+                     '/api/v1/books/123.html', '/api/v1/books/123/comments/abc/',
+                     '/api/v1/books/123/comments/abc/def', '/api/v1/books/123/comment',
+                     '/api/v1/orders/123/', '/api/v1/orders/123.json/', '/api/v1/orders/',
+                     '/api/v1/orders/123.json.json/', '/', '/api/v1/', '/api/v1/books/']
+            ok (r._redirect_rexp) != None
+            ok ([ r.find_redirect(p) for p in paths ]) == [ router.find_redirect(p) for p in paths ]
+
+    with subject("#find_many()"):
+
+        @test("returns the same results as #find() for each urlpath.")
+        def _(self, router):
+            paths = ['/', '/api/v1/books.json', '/api/v1/books/123.json',
+                     '/api/v1/orders/123', '/api/v1/books/123/comments/abcd',
+                     '/api/v1/books/abc.json', '', '/api/v1/orders/123.json']
+            expected = [ router.find(p) for p in paths ]
+            ok (router.find_many(paths)) == expected
+            ok (router.find_many(iter(paths))) == expected
+
+        @test("returns separated param args list for duplicated urlpaths.")
+        def _(self, router):
+            path = '/api/v1/books/123/comments/abcd'
+            results = router.find_many([path, '/api/v1/books.json', path, path])
+            ok (len(results)) == 4
+            ok (results[0]) == router.find(path)
+            ok (results[2]) == results[0]
+            ok (results[3]) == results[0]
+            ok (results[2][2]).is_not(results[0][2])
+            ok (results[3][2]).is_not(results[2][2])
+
+    with subject("#lookup_many()"):
+
+        @test("returns the same results as #lookup() for each urlpath.")
+        def _(self, router):
+            paths = ['/api/v1/books/123.json', '/api/v1/books.json', '/api/v1/books/abc.json']
+            c = BooksAPI
+            ok (router.lookup_many('GET', paths)) == [(c, c.do_show, [123]),
+                                                      (c, c.do_index, []),
+                                                      (None, None, None)]
+            ok (router.lookup_many(['PUT', 'POST', 'GET'], paths)) == [(c, c.do_update, [123]),
+                                                                       (c, c.do_create, []),
+                                                                       (None, None, None)]
+
+    with subject(".load_snapshot()"):
+
+        @test("restores router saved by #save_snapshot().")
+        def _(self, router, snapshot_file):
+            router.save_snapshot(snapshot_file, LIST_MAPPING)
+            router2 = router.__class__.load_snapshot(snapshot_file, LIST_MAPPING)
+            ok (router2).is_a(router.__class__)
+            self._test_when_found(router2)
+            self._test_when_not_found(router2)
+
+        @test("returns None when snapshot file is stale or not found.")
+        def _(self, router, snapshot_file):
+            klass = router.__class__
+            ok (klass.load_snapshot(snapshot_file, LIST_MAPPING)) == None
+            router.save_snapshot(snapshot_file, LIST_MAPPING)
+            ok (klass.load_snapshot(snapshot_file, LIST_MAPPING[1:])) == None
+
+        @test("returns None when snapshot file is truncated or corrupted.")
+        def _(self, router, snapshot_file):
+            klass = router.__class__
+            router.save_snapshot(snapshot_file, LIST_MAPPING)
+            with open(snapshot_file, 'rb') as f:
+                data = f.read()
+            for broken in (data[:len(data)//2], data[:-1], b"", b"xxx" + data[3:]):
+                with open(snapshot_file, 'wb') as f:
+                    f.write(broken)
+                ok (klass.load_snapshot(snapshot_file, LIST_MAPPING)) == None
+
+    with subject("#allowed_methods()"):
+
+        @test("returns allowed request methods.")
+        def _(self, router):
+            ok (router.allowed_methods('/api/v1/books/123.json')) == {'GET', 'HEAD', 'PUT', 'DELETE'}
+            ok (router.allowed_methods('/api/v1/books.json')) == {'GET', 'HEAD', 'POST'}
+            ok (router.allowed_methods('/api/v1/books/abc.json')) == None
+
 
 class NaiveLinearRouter_TestCase(Router_TestBase):
     ROUTER_CLASS = NaiveLinearRouter
@@ -180,6 +439,89 @@ class HashedLinearRouter_TestCase(Router_TestBase):
     ROUTER_CLASS = HashedLinearRouter
 
 
+class UsersAPI(RequestHandler):
+
+    with on.path('/{name}'):
+        @on('GET')
+        def do_show(self, name):
+            return {"action": "show", "name": name}
+
+    with on.path('/new'):    # shadowed by '/{name}' in linear routers
+        @on('GET')
+        def do_new(self):
+            return {"action": "new"}
+
+    with on.path('/{id:int}/edit'):
+        @on('GET')
+        def do_edit(self, id):
+            return {"action": "edit", "id": id}
+
+
+class AdaptiveRouter_TestBase(object):
+
+    ROUTER_CLASS = None
+    MAPPING = [('/users', UsersAPI), ('/api/v1', LIST_MAPPING[1][1])]
+
+    def _entries(self, router):
+        return router._mapping_list
+
+    with subject("#__init__(adaptive=n)"):
+
+        @test("reorders routes by hit count, keeping first-match semantics.")
+        def _(self):
+            paths = ['/users/new', '/users/foo', '/users/1/edit',
+                     '/api/v1/books/123.json', '/api/v1/orders/123.html']
+            expected = [ self.ROUTER_CLASS(self.MAPPING).find(p) for p in paths ]
+            router = self.ROUTER_CLASS(self.MAPPING, adaptive=10)
+            for _ in range(20):
+                router.find('/users/1/edit')
+                router.find('/users/1/edit')
+                router.find('/users/new')
+            ok ([ router.find(p) for p in paths ]) == expected
+            entries = self._entries(router)
+            ok (entries[0][0]) == '/users/{id:int}/edit'
+            patterns = [ t[0] for t in entries ]
+            if '/users/new' in patterns:
+                ok (patterns.index('/users/{name}')) < patterns.index('/users/new')
+
+        @test("#find_many() counts hits as well as #find().")
+        def _(self):
+            router = self.ROUTER_CLASS(self.MAPPING, adaptive=10)
+            router.find_many([ '/users/%s/edit' % i for i in range(20) ])
+            entries = self._entries(router)
+            ok (entries[0][0]) == '/users/{id:int}/edit'
+
+        @test("builds overlap graph in constructor, not in #find().")
+        def _(self):
+            router = self.ROUTER_CLASS(self.MAPPING, adaptive=10)
+            ok (router._overlaps) != {}
+            def _overlap_graph(entries):
+                raise AssertionError("overlap graph built in find()")
+            router._overlap_graph = _overlap_graph
+            router._segments_overlap = _overlap_graph
+            for _ in range(20):
+                ok (router.find('/users/1/edit')) != None
+
+
+class NaiveLinearRouterAdaptive_TestCase(AdaptiveRouter_TestBase):
+    ROUTER_CLASS = NaiveLinearRouter
+
+
+class PrefixLinearRouterAdaptive_TestCase(AdaptiveRouter_TestBase):
+    ROUTER_CLASS = PrefixLinearRouter
+
+
+class FixedLinearRouterAdaptive_TestCase(AdaptiveRouter_TestBase):
+    ROUTER_CLASS = FixedLinearRouter
+
+
+class HashedLinearRouterAdaptive_TestCase(AdaptiveRouter_TestBase):
+    ROUTER_CLASS = HashedLinearRouter
+
+    def _entries(self, router):
+        return router._mapping_hash['/users/']
+
+
 class NaiveRegexpRouter_TestCase(Router_TestBase):
     ROUTER_CLASS = NaiveRegexpRouter
 
@@ -196,23 +538,966 @@ class OptimizedRegexpRouter_TestCase(Router_TestBase):
     ROUTER_CLASS = OptimizedRegexpRouter
 
 
+class OptimizedRegexpRouterCapture_TestCase(object):
+
+    def provide_router(self):
+        return OptimizedRegexpRouter(LIST_MAPPING)
+
+    with subject("#find()"):
+
+        @test("extracts params from a single match of combined regexp.")
+        def _(self, router):
+            m = router._all_regexp.match("/api/v1/books/123/comments/abc")
+            ok (m) != None
+            handler_class, _, pairs = router._group_table[m.lastindex]
+            ok (handler_class) == BookCommentsAPI
+            ok ([ m.group(j) for j, _ in pairs ]) == ["123", "abc"]
+            ## param groups are not contiguous because tree shares prefix
+            ok (pairs[1][0] - pairs[0][0]) > 1
+            ## per-route regexp is not used
+            router._mapping_list = [ t[:1] + (None,) + t[2:] for t in router._mapping_list ]
+            t = router.find("/api/v1/books/123/comments/abc")
+            ok (t) == (BookCommentsAPI, {'GET': BookCommentsAPI.do_show,
+                                         'PUT': BookCommentsAPI.do_update,
+                                         'DELETE': BookCommentsAPI.do_delete}, [123, "abc"])
+
+
 class SlicedRegexpRouter_TestCase(Router_TestBase):
     ROUTER_CLASS = SlicedRegexpRouter
 
 
+class PullsAPI(RequestHandler):
+
+    with on.path('/{owner}/{repo}/pulls/{pull_number:int}/reviews/{review_id:int}/comments'):
+        @on('GET')
+        def do_comments(self, owner, repo, pull_number, review_id):
+            pass
+
+    with on.path('/{owner}/{repo}/files/{filepath:path}'):
+        @on('GET')
+        def do_file(self, owner, repo, filepath):
+            pass
+
+
+class SlicedRegexpRouterSlice_TestCase(object):
+
+    def provide_router(self):
+        return SlicedRegexpRouter([])
+
+    with subject("#_slice()"):
+
+        @test("returns slice and separators of params.")
+        def _(self, router):
+            ok (router._slice('/books/{id:int}.json')) == (slice(7, -5), None, False)
+            ok (router._slice('/books/{id:int}.*')) == (slice(7, None), None, True)
+            ok (router._slice('/{owner}/{repo}/{name}')) == (slice(1, None), '/', False)
+            ok (router._slice('/repos/{owner}/{repo}/pulls/{pull_number:int}/reviews/{review_id:int}/comments')) \
+                == (slice(7, -9), ('/', '/pulls/', '/reviews/'), False)
+            ok (router._slice('/files/{owner}/{filepath:path}')) == (slice(7, None), '/', False)
+
+        @test("returns None when params can't be sliced.")
+        def _(self, router):
+            ok (router._slice('/{a}{b}')) == (None, None, False)
+            ok (router._slice('/{filepath:path}/{name}')) == (None, None, False)
+            ok (router._slice('/{id:int}1/{name}')) == (None, None, False)
+            ok (router._slice('/{filepath:path}.*')) == (None, None, True)
+
+    with subject("#find()"):
+
+        @test("extracts any number of params by slicing.")
+        def _(self):
+            router = SlicedRegexpRouter([('/repos', PullsAPI)])
+            t = router.find('/repos/foo/bar/pulls/123/reviews/456/comments')
+            ok (t[0]) == PullsAPI
+            ok (t[2]) == ["foo", "bar", 123, 456]
+            t = router.find('/repos/foo/bar/files/src/main.py')
+            ok (t[2]) == ["foo", "bar", "src/main.py"]
+
+
 class HashedRegexpRouter_TestCase(Router_TestBase):
     ROUTER_CLASS = HashedRegexpRouter
 
 
+class RouteUpdate_TestBase(object):
+
+    ROUTER_CLASS = None
+
+    def provide_router(self):
+        return self.ROUTER_CLASS(LIST_MAPPING)
+
+    with subject("#add_route()"):
+
+        @test("adds new route.")
+        def _(self, router):
+            c = BooksAPI
+            methods = {"GET": c.do_show}
+            router.add_route('/api/v1/authors/{id:int}/books', c, methods)
+            router.add_route('/api/v1/books/{id:int}.html', c, methods)
+            router.add_route('/api/v1/authors', c, methods)
+            ok (router.find('/api/v1/authors/7/books')) == (c, methods, [7])
+            ok (router.find('/api/v1/books/8.html')) == (c, methods, [8])
+            ok (router.find('/api/v1/authors')) == (c, methods, [])
+            ok (router.lookup('HEAD', '/api/v1/authors')) == (c, c.do_show, [])
+            Router_TestBase()._test_when_found(router)
+
+        @test("raises error when urlpath is duplicated.")
+        def _(self, router):
+            c = BooksAPI
+            def fn(): router.add_route('/api/v1/books/{id:int}.json', c, {"GET": c.do_show})
+            ok (fn).raises(RouterError)
+
+        @test("raises error before updating router when route is invalid.")
+        def _(self, router):
+            c = BooksAPI
+            route_count = router._route_count
+            for path_pat, handler_class in [
+                ('/api/v1/authors/{id:int:x}', c),     # invalid placeholder
+                ('/api/v1/authors/{id}/{id}', c),      # duplicated param
+                ('/api/v1/authors/{id:foo}', c),       # unknown param type
+                ('/api/v1/authors/{id}', object),      # not a handler class
+                ('/api/v1/authors', object),
+            ]:
+                def fn(): router.add_route(path_pat, handler_class, {"GET": c.do_show})
+                ok (fn).raises(RouterError)
+            ok (router._route_count) == route_count
+            ok (router.find('/api/v1/authors/1')) == None
+            ok (router.find('/api/v1/authors')) == None
+            Router_TestBase()._test_when_found(router)
+
+        @test("updates redirect location built by #build_redirects().")
+        def _(self, router):
+            router.build_redirects(LIST_MAPPING)
+            c = BooksAPI
+            router.add_route('/api/v1/authors/{id:int}/books', c, {"GET": c.do_show})
+            router.add_route('/api/v1/authors', c, {"GET": c.do_show})
+            ok (router.find_redirect('/api/v1/authors/7/books/')) == '/api/v1/authors/7/books'
+            ok (router.find_redirect('/api/v1/authors/')) == '/api/v1/authors'
+
+    with subject("#remove_route()"):
+
+        @test("removes existing route.")
+        def _(self, router):
+            router.remove_route('/api/v1/books/{book_id:int}/comments/{code}')
+            router.remove_route('/api/v1/books.json')
+            ok (router.find('/api/v1/books/123/comments/abc')) == None
+            ok (router.find('/api/v1/books.json')) == None
+            c = BookCommentsAPI
+            t = router.find('/api/v1/books/123/comments')
+            ok (t) == (c, {"GET": c.do_index, "POST": c.do_create}, [123])
+            c = BooksAPI
+            t = router.find('/api/v1/books/123.json')
+            ok (t) == (c, {"GET": c.do_show, "PUT": c.do_update, "DELETE": c.do_delete}, [123])
+            #
+            router.remove_route('/api/v1/books/{book_id:int}/comments')
+            router.remove_route('/api/v1/books/{id:int}.json')
+            router.remove_route('/api/v1/orders/{id}.*')
+            router.remove_route('/api/v1/orders/{id}/edit.html')
+            ok (router.find('/api/v1/books/123.json')) == None
+            ok (router.find('/api/v1/orders/123')) == None
+
+        @test("raises error when urlpath not found.")
+        def _(self, router):
+            def fn(): router.remove_route('/api/v1/books/{id:int}.html')
+            ok (fn).raises(RouterError)
+            def fn(): router.remove_route('/api/v1/books.html')
+            ok (fn).raises(RouterError)
+
+        @test("updates redirect location built by #build_redirects().")
+        def _(self, router):
+            router.build_redirects(LIST_MAPPING)
+            ok (router.find_redirect('/api/v1/orders')) == '/api/v1/orders/'
+            ok (router.find_redirect('/api/v1/books/123.json/')) == '/api/v1/books/123.json'
+            router.remove_route('/api/v1/orders/')
+            router.remove_route('/api/v1/books/{id:int}.json')
+            ok (router.find_redirect('/api/v1/orders')) == None
+            ok (router.find_redirect('/api/v1/books/123.json/')) == None
+
+
+class OptimizedRegexpRouterUpdate_TestCase(RouteUpdate_TestBase):
+    ROUTER_CLASS = OptimizedRegexpRouter
+
+
+class SlicedRegexpRouterUpdate_TestCase(RouteUpdate_TestBase):
+    ROUTER_CLASS = SlicedRegexpRouter
+
+
+class HashedRegexpRouterUpdate_TestCase(RouteUpdate_TestBase):
+    ROUTER_CLASS = HashedRegexpRouter
+
+
+class HashedRegexpRouterLazy_TestCase(object):
+
+    def provide_router(self):
+        return HashedRegexpRouter(LIST_MAPPING, lazy=True)
+
+    with subject("#__init__(lazy=True)"):
+
+        @test("builds subrouter on first find() into the prefix.")
+        def _(self, router):
+            ok (router.shard_info()["loaded"]) == 0
+            ok (router.find('/api/v1/books.json')) == HashedRegexpRouter(LIST_MAPPING).find('/api/v1/books.json')
+            ok (router.shard_info()["loaded"]) == 0
+            Router_TestBase()._test_when_found(router)
+            Router_TestBase()._test_when_not_found(router)
+            info = router.shard_info()
+            ok (info["shards"]) == 3
+            ok (info["loaded"]) == 3
+            ok (info["loads"]) == 3
+
+        @test("unloads least recently used shard when 'max_shards' specified.")
+        def _(self):
+            router = HashedRegexpRouter(LIST_MAPPING, max_shards=1)
+            router.find('/api/v1/books/123.json')
+            router.find('/api/v1/orders/123.json')
+            ok (list(router._subrouters)) == ['/api/v1/order']
+            router.find('/api/v1/books/123.json')
+            ok (router.find_many(['/api/v1/orders/1', '/api/v1/books/2.json'])) == \
+                [ HashedRegexpRouter(LIST_MAPPING).find(p) for p in ['/api/v1/orders/1', '/api/v1/books/2.json'] ]
+            info = router.shard_info()
+            ok (info["loaded"]) == 1
+            ok (info["loads"]) == 5
+            ok (info["unloads"]) == 4
+            ok (list(router._subrouters)) == ['/api/v1/books']
+
+        @test("never unloads shard updated by #add_route().")
+        def _(self):
+            router = HashedRegexpRouter(LIST_MAPPING, max_shards=1)
+            c = BooksAPI
+            router.add_route('/api/v1/books/{id:int}.html', c, {"GET": c.do_show})
+            router.find('/api/v1/orders/123.json')
+            ok (router.find('/api/v1/books/8.html')) == (c, {"GET": c.do_show}, [8])
+            ok (router.shard_info()["unloads"]) == 1
+
+        @test("lazy router can be saved into snapshot.")
+        def _(self, router):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                fname = os.path.join(tmpdir, "router.snapshot")
+                router.find('/api/v1/books/123.json')
+                router.save_snapshot(fname, LIST_MAPPING)
+                router2 = HashedRegexpRouter.load_snapshot(fname, LIST_MAPPING)
+                ok (router2.shard_info()["loaded"]) == 1
+                Router_TestBase()._test_when_found(router2)
+                ok (router2.shard_info()["loaded"]) == 2
+
+        @test("lazy router built from RouteTable can be saved into snapshot.")
+        def _(self):
+            router = HashedRegexpRouter(RouteTable(LIST_MAPPING), lazy=True)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                fname = os.path.join(tmpdir, "router.snapshot")
+                router.save_snapshot(fname, LIST_MAPPING)
+                router2 = HashedRegexpRouter.load_snapshot(fname, LIST_MAPPING)
+                ok (router2.shard_info()["loaded"]) == 0
+                Router_TestBase()._test_when_found(router2)
+                Router_TestBase()._test_when_not_found(router2)
+
+
+class ShardedRegexpRouter_TestCase(Router_TestBase):
+    ROUTER_CLASS = staticmethod(lambda mapping: ShardedRegexpRouter(mapping, max_routes=1))
+
+
+class ShardedRegexpRouterUpdate_TestCase(RouteUpdate_TestBase):
+    ROUTER_CLASS = staticmethod(lambda mapping: ShardedRegexpRouter(mapping, max_routes=2))
+
+
+class ShardedRegexpRouterShard_TestCase(object):
+
+    with subject("#__init__()"):
+
+        @test("shards routes by path segment only while they exceed 'max_routes'.")
+        def _(self):
+            router = ShardedRegexpRouter(LIST_MAPPING)
+            ok (router.shard_info()["shards"]) == 1
+            ok (router.shard_info()["depth"]) == 0
+            router = ShardedRegexpRouter(LIST_MAPPING, max_routes=2)
+            info = router.shard_info()
+            ok (info["sizes"]) == {"/api/v1/books/*": 1, "/api/v1/books/*/comments": 2,
+                                   "/api/v1/orders": 2}
+            ok (info["shards"]) == 3
+            ok (info["depth"]) == 5
+            ok (info["largest"]) == 2
+            ok (info["average"]) == 5 / 3
+            ok (info["max_routes"]) == 2
+
+        @test("finds route in other shard when not found in static shard.")
+        def _(self):
+            mapping = [
+                ('/{org}/repos', ReposAPI),
+                ('/admin/repos/{id:int}', ReposAPI),
+            ]
+            router = ShardedRegexpRouter(mapping, max_routes=1)
+            ok (router.shard_info()["sizes"]) == {"/*": 1, "/admin": 1}
+            c = ReposAPI
+            ok (router.lookup('GET', '/admin/repos/1/x')) == (c, c.do_show, [1, "x"])
+            ok (router.lookup('GET', '/admin/repos/x')) == (c, c.do_show, ["admin", "x"])
+            ok (router.lookup('GET', '/acme/repos/x')) == (c, c.do_show, ["acme", "x"])
+            ok (router.find('/acme/users/x')) == None
+
+    with subject("#find()"):
+
+        @test("returns the first declared route regardless of number of routes.")
+        def _(self):
+            c = ReposAPI
+            paths = ['/api/acme/repos/x', '/api/acme/repos/x/1', '/api/foo/repos/x/1']
+            results = []
+            for n in (0, 100):    # not sharded, and sharded
+                mapping = [('/api/{org}/repos', c), ('/api/acme/repos', c)]
+                mapping += [ ('/api/pad%03d' % i, c) for i in range(n) ]
+                router = ShardedRegexpRouter(mapping, max_routes=64)
+                ok (router.shard_info()["shards"]) == (1 if n == 0 else 2 + n)
+                ok (router.lookup('GET', '/api/acme/repos/x')) == (c, c.do_show, ["acme", "x"])
+                router.add_route('/api/{org}/repos/x/{id:int}', c, {"GET": c.do_find})
+                router.add_route('/api/acme/repos/{name}/{id:int}', c, {"GET": c.do_show})
+                ok (router.lookup('GET', '/api/acme/repos/x/1')) == (c, c.do_find, ["acme", 1])
+                results.append([ router.find(p) for p in paths ])
+            ok (results[1]) == results[0]
+
+        @test("finds route which has '.*' suffix in static segment.")
+        def _(self):
+            class IndexAPI(RequestHandler):
+                with on.path('/{id:int}/index.*'):
+                    @on('GET')
+                    def do_index(self, org, id):
+                        pass
+                with on.path('/{id:int}/edit'):
+                    @on('GET')
+                    def do_edit(self, org, id):
+                        pass
+            c = IndexAPI
+            router = ShardedRegexpRouter([('/api/{org}', c)], max_routes=1)
+            ok (router.shard_info()["sizes"]) == {"/api/*/*/*": 1, "/api/*/*/edit": 1}
+            ok (router.lookup('GET', '/api/acme/1/index.json')) == (c, c.do_index, ["acme", 1])
+            ok (router.lookup('GET', '/api/acme/1/index')) == (c, c.do_index, ["acme", 1])
+            ok (router.find('/api/acme/1/about.json')) == None
+            router.add_route('/api/{org}/{id:int}/about.*', c, {"GET": c.do_index})
+            ok (router.lookup('GET', '/api/acme/1/about.json')) == (c, c.do_index, ["acme", 1])
+
+
+class ReposAPI(RequestHandler):
+
+    with on.path('/{name}'):
+        @on('GET')
+        def do_show(self, owner, name):
+            pass
+
+    def do_find(self, *params):    # for route added by 'add_route()'
+        pass
+
+
 class TrieRouter_TestCase(Router_TestBase):
     ROUTER_CLASS = TrieRouter
 
 
+class RadixTrieRouter_TestCase(Router_TestBase):
+    ROUTER_CLASS = RadixTrieRouter
+
+
+class RunnersAPI(RequestHandler):
+
+    with on.path('/{owner}/actions/runners/generate-jitconfig'):
+        @on('POST')
+        def do_jitconfig(self, owner):
+            pass
+
+    with on.path('/{owner}/actions/runners/{runner_id:int}'):
+        @on('GET')
+        def do_show(self, owner, runner_id):
+            pass
+
+    with on.path('/{owner}/hooks/config/deliveries/{delivery_id:int}/attempts'):
+        @on('POST')
+        def do_attempts(self, owner, delivery_id):
+            pass
+
+
+class RadixTrieRouterCompress_TestCase(object):
+
+    def provide_router(self):
+        return RadixTrieRouter([('/orgs', RunnersAPI)])
+
+    with subject("#__init__()"):
+
+        @test("merges static segments which have no branch into a node.")
+        def _(self, router):
+            node = router._tree_root.edges['orgs'].str_child
+            ok (sorted(node.edges.keys())) == ['actions', 'hooks']
+            node2 = node.edges['actions']
+            ok (node2.rest) == ('runners',)
+            ok (sorted(node2.edges.keys())) == ['generate-jitconfig']
+            node3 = node.edges['hooks']
+            ok (node3.rest) == ('config', 'deliveries')
+            ok (node3.int_child.edges['attempts'].rest) == ()
+
+    with subject("#find()"):
+
+        @test("compares merged segments.")
+        def _(self, router):
+            t = router.find('/orgs/foo/actions/runners/generate-jitconfig')
+            ok (t[0]) == RunnersAPI
+            ok (t[2]) == ["foo"]
+            t = router.find('/orgs/foo/hooks/config/deliveries/123/attempts')
+            ok (t[2]) == ["foo", 123]
+            ok (router.find('/orgs/foo/hooks/config/deliveries')) == None
+            ok (router.find('/orgs/foo/hooks/config/xxx/123/attempts')) == None
+            ok (router.find('/orgs/foo/hooks/config/deliveries/abc/attempts')) == None
+
+
+class BacktrackUsersAPI(RequestHandler):
+
+    with on.path('/new/{id:int}'):
+        @on('GET')
+        def do_new(self, id):
+            pass
+
+    with on.path('/{name}/edit'):
+        @on('GET')
+        def do_edit(self, name):
+            pass
+
+    with on.path('/{user_id:int}/posts.json'):
+        @on('GET')
+        def do_posts(self, user_id):
+            pass
+
+    with on.path('/{name}/posts.*'):
+        @on('GET')
+        def do_feed(self, name):
+            pass
+
+
+class TrieRouterBacktrack_TestCase(object):
+
+    ROUTER_CLASSES = (TrieRouter, RadixTrieRouter, StateMachineRouter,
+                      CompactStateMachineRouter, CompiledRouter)
+
+    with subject("#find()"):
+
+        @test("tries other edges when greedy lookup failed.")
+        def _(self):
+            c = BacktrackUsersAPI
+            for router_class in self.ROUTER_CLASSES:
+                router = router_class([('/users', c)])
+                ok (router._backtracking) == True
+                ok (router.lookup('GET', '/users/new/123')) == (c, c.do_new, [123])
+                ok (router.lookup('GET', '/users/new/edit')) == (c, c.do_edit, ['new'])
+                ok (router.lookup('GET', '/users/123/edit')) == (c, c.do_edit, ['123'])
+                ok (router.lookup('GET', '/users/123/posts.json')) == (c, c.do_posts, [123])
+                ok (router.lookup('GET', '/users/123/posts.xml')) == (c, c.do_feed, ['123'])
+                ok (router.find('/users/new/xyz')) == None
+
+        @test("tries other edges after merged static segments of radix trie.")
+        def _(self):
+            c = BacktrackUsersAPI
+            router = RadixTrieRouter([('/users/me/settings', c), ('/users', c)])
+            ok (router._tree_root.edges['users'].edges['me'].rest) == ('settings',)
+            ok (router.lookup('GET', '/users/me/settings/123/posts.json')) == (c, c.do_posts, [123])
+            ok (router.lookup('GET', '/users/me/edit')) == (c, c.do_edit, ['me'])
+            ok (router.lookup('GET', '/users/me/posts.xml')) == (c, c.do_feed, ['me'])
+
+        @test("doesn't backtrack when edges never overlap.")
+        def _(self):
+            for router_class in self.ROUTER_CLASSES:
+                ok (router_class(LIST_MAPPING)._backtracking) == False
+
+
+class ReportsAPI(RequestHandler):
+
+    with on.path('/{id:int}.json'):
+        @on('GET')
+        def do_json(self, id):
+            pass
+
+    with on.path('/{id:int}.csv'):
+        @on('GET')
+        def do_csv(self, id):
+            pass
+
+
+class TrieRouterSuffix_TestCase(object):
+
+    ROUTER_CLASSES = (TrieRouter, RadixTrieRouter, StateMachineRouter,
+                      CompactStateMachineRouter, CompiledRouter)
+
+    with subject("#find()"):
+
+        @test("dispatches routes which differ only in suffix.")
+        def _(self):
+            for router_class in self.ROUTER_CLASSES:
+                router = router_class([('/reports', ReportsAPI), ('/users', BacktrackUsersAPI)])
+                ok (router.lookup('GET', '/reports/1.json')) == (ReportsAPI, ReportsAPI.do_json, [1])
+                ok (router.lookup('GET', '/reports/1.csv')) == (ReportsAPI, ReportsAPI.do_csv, [1])
+                ok (router.find('/reports/1.xml')) == None
+                ok (router.find('/reports/1')) == None
+                ok (router.lookup('GET', '/users/1/posts.json')) == (BacktrackUsersAPI, BacktrackUsersAPI.do_posts, [1])
+
+        @test("rejects suffix which no route accepts before walking tree.")
+        def _(self):
+            for router_class in self.ROUTER_CLASSES:
+                router = router_class([('/reports', ReportsAPI)])
+                ok (router._suffixes) == {'.json', '.csv'}
+                ok (router.find('/reports/1.xml')) == None
+                ok (router_class(LIST_MAPPING)._suffixes) == None   # has '.*'
+
+
+class TrieRouterIntSegment_TestCase(object):
+
+    ROUTER_CLASSES = TrieRouterSuffix_TestCase.ROUTER_CLASSES
+
+    with subject("#find()"):
+
+        @test("returns None instead of raising error when int segment is too long.")
+        def _(self):
+            path = '/api/v1/books/' + '1'*5000 + '.json'
+            for router_class in self.ROUTER_CLASSES:
+                router = router_class(LIST_MAPPING)
+                ok (router.find(path)) == None
+                ok (router.find('/api/v1/books/123.json')[2]) == [123]
+
+
+class SegmentClassifier_TestCase(object):
+
+    def provide_classifier(self):
+        return SegmentClassifier(cache_size=3)
+
+    with subject("#int_value()"):
+
+        @test("returns int value, or -1 if segment is not non-negative integer.")
+        def _(self, classifier):
+            ok (classifier.int_value('123')) == 123
+            ok (classifier.int_value('0')) == 0
+            ok (classifier.int_value('hello-world')) == -1
+            ok (classifier.int_value('-1')) == -1
+            ok (classifier.int_value('')) == -1
+
+        @test("returns -1 if segment has more digits than int() accepts.")
+        @skip.when(not hasattr(sys, 'get_int_max_str_digits'), "requires int digits limit")
+        def _(self, classifier):
+            ok (classifier.int_value('1'*5000)) == -1
+
+        @test("caches results up to cache size.")
+        def _(self, classifier):
+            classifier.int_value('123')
+            classifier.int_value('abc')
+            ok (classifier.int_values) == {'123': 123, 'abc': -1}
+            classifier.int_value('456')
+            classifier.int_value('xyz')
+            ok (classifier.int_values) == {'xyz': -1}
+
+    with subject("#classify()"):
+
+        @test("returns EMPTY, INT or STR.")
+        def _(self, classifier):
+            ok (classifier.classify('')) == SegmentClassifier.EMPTY
+            ok (classifier.classify('123')) == SegmentClassifier.INT
+            ok (classifier.classify('abc')) == SegmentClassifier.STR
+
+
 class StateMachineRouter_TestCase(Router_TestBase):
     ROUTER_CLASS = StateMachineRouter
     TUPLE_TYPE = staticmethod(lambda xs: [ (int(x) if x.isdigit() else x) for x in xs ])
 
 
+class CompactStateMachineRouter_TestCase(Router_TestBase):
+    ROUTER_CLASS = CompactStateMachineRouter
+
+
+class CompactStateMachineRouterTable_TestCase(object):
+
+    def provide_router(self):
+        return CompactStateMachineRouter(LIST_MAPPING)
+
+    with subject("#__init__()"):
+
+        @test("stores states as integer in flat tables.")
+        def _(self, router):
+            ok (router._transition) == None
+            static = router._static
+            ok (static['api']) == (0, 1)
+            ok (static['v1']) == (1, 2)
+            state = static['books'][1]
+            ok (router._int_next[state]) > state
+            ok (router._str_next[state]) == -1
+            ok (static['comments']).is_a(tuple)
+            n = len(router._targets)
+            ok (len(router._int_next)) == n
+            ok (len(router._str_next)) == n
+            ok (len(router._pathnext)) == n
+
+        @test("uses dict for segment which appears in several states.")
+        def _(self):
+            class FooAPI(RequestHandler):
+                with on.path('/{x}/edit'):
+                    @on('GET')
+                    def do_x(self, x): pass
+                with on.path('/{id:int}/edit'):
+                    @on('GET')
+                    def do_id(self, id): pass
+            router = CompactStateMachineRouter([('/foo', FooAPI)])
+            ok (router._static['edit']).is_a(dict)
+            ok (len(router._static['edit'])) == 2
+            ok (router.lookup('GET', '/foo/123/edit')) == (FooAPI, FooAPI.do_id, [123])
+            ok (router.lookup('GET', '/foo/abc/edit')) == (FooAPI, FooAPI.do_x, ['abc'])
+
+
+class CompiledRouter_TestCase(Router_TestBase):
+    ROUTER_CLASS = CompiledRouter
+
+
+class CompiledRouterSource_TestCase(object):
+
+    with subject("#__init__()"):
+
+        @test("dumps generated source code when 'dump' specified.")
+        def _(self):
+            out = io.StringIO()
+            router = CompiledRouter(LIST_MAPPING, dump=out)
+            ok (out.getvalue()) == router.source()
+            ok (router.source().startswith("def find(req_path):\n")) == True
+            ok ("    p0 = _int_value(x3)\n").in_(router.source())
+
+
+class DFARouter_TestCase(Router_TestBase):
+    ROUTER_CLASS = DFARouter
+
+
+class DFARouterMatch_TestCase(object):
+
+    def provide_param_types(self):
+        return _save_param_types()
+
+    def release_param_types(self, value):
+        _restore_param_types(value)
+
+    with subject("#find()"):
+
+        @test("returns the first declared route when routes are overlapped.")
+        def _(self):
+            class FooAPI(RequestHandler):
+                with on.path('/{x}/foo'):
+                    @on('GET')
+                    def do_foo(self, x): pass
+                with on.path('/abc/{y}'):
+                    @on('GET')
+                    def do_abc(self, y): pass
+                with on.path('/{x}/bar'):
+                    @on('GET')
+                    def do_bar(self, x): pass
+            router = DFARouter([('/api', FooAPI)])
+            ok (router.lookup('GET', '/api/abc/bar')) == (FooAPI, FooAPI.do_abc, ['bar'])
+            ok (router.lookup('GET', '/api/xyz/bar')) == (FooAPI, FooAPI.do_bar, ['xyz'])
+            ok (router.lookup('GET', '/api/abc/foo')) == (FooAPI, FooAPI.do_foo, ['abc'])
+
+        @test("classifies non-ascii chars in the same way as regexp.")
+        def _(self):
+            router = DFARouter(LIST_MAPPING)
+            ok (router.find('/api/v1/books/\u0661\u0662.json')[2]) == [12]   # arabic-indic digits
+            ok (router.find('/api/v1/books/1/comments/caf\u00e9')[2]) == [1, 'caf\u00e9']
+            ok (router.find('/api/v1/orders/caf\u00e9.json')) == None
+
+    with subject("#__init__()"):
+
+        @test("raises error when custom param type is used.")
+        def _(self, param_types):
+            Router.register_param_type('uuid', r'[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12}', uuid.UUID)
+            Router.register_param_type('hex', r'[0-9a-f]+', hex2int)
+            def fn(): DFARouter([('/items', ItemsAPI)])
+            ok (fn).raises(RouterError, "/items/{item_id:uuid}: param type 'uuid' is not supported by DFARouter.")
+
+
+class DFARouterSharedTables_TestCase(object):
+
+    def provide_tables_file(self):
+        return os.path.join(tempfile.mkdtemp(), "router.dfa")
+
+    def release_tables_file(self, value):
+        shutil.rmtree(os.path.dirname(value), ignore_errors=True)
+
+    with subject(".attach_shared_tables()"):
+
+        @test("attaches tables saved by '#save_shared_tables()' without copy.")
+        def _(self, tables_file):
+            router = DFARouter(LIST_MAPPING)
+            router.save_shared_tables(tables_file, LIST_MAPPING)
+            router2 = DFARouter.attach_shared_tables(tables_file, LIST_MAPPING)
+            ok (router2).is_a(DFARouter)
+            ok (router2._transition).is_a(memoryview)
+            ok (router2._transition.readonly) == True
+            ok (list(router2._transition)) == list(router._transition)
+            ok (list(router2._accept)) == list(router._accept)
+            Router_TestBase()._test_when_found(router2)
+            Router_TestBase()._test_when_not_found(router2)
+
+        @test("returns None when file not found or stale.")
+        def _(self, tables_file):
+            ok (DFARouter.attach_shared_tables(tables_file, LIST_MAPPING)) == None
+            DFARouter(LIST_MAPPING).save_shared_tables(tables_file, LIST_MAPPING)
+            mapping = LIST_MAPPING[1:]
+            ok (DFARouter.attach_shared_tables(tables_file, mapping)) == None
+
+        @test("returns None when file is empty or truncated.")
+        def _(self, tables_file):
+            DFARouter(LIST_MAPPING).save_shared_tables(tables_file, LIST_MAPPING)
+            with open(tables_file, 'rb') as f:
+                data = f.read()
+            for size in (0, 40, len(data) - 1, len(data) // 2):
+                with open(tables_file, 'wb') as f:
+                    f.write(data[:size])
+                ok (DFARouter.attach_shared_tables(tables_file, LIST_MAPPING)) == None
+
+        @test("attached router can be saved into snapshot.")
+        def _(self, tables_file):
+            DFARouter(LIST_MAPPING).save_shared_tables(tables_file, LIST_MAPPING)
+            router = DFARouter.attach_shared_tables(tables_file, LIST_MAPPING)
+            fname = tables_file + ".snapshot"    # removed together with tables file
+            router.save_snapshot(fname, LIST_MAPPING)
+            router2 = DFARouter.load_snapshot(fname, LIST_MAPPING)
+            ok (router2._transition).is_a(array)
+            Router_TestBase()._test_when_found(router2)
+
+
+class AutoRouter_TestCase(Router_TestBase):
+    ROUTER_CLASS = staticmethod(lambda mapping: AutoRouter(mapping, loop=100))
+
+
+class AutoRouterReport_TestCase(object):
+
+    with subject("#__init__()"):
+
+        @test("chooses the fastest router among candidates.")
+        def _(self):
+            candidates = (OptimizedRegexpRouter, TrieRouter)
+            router = AutoRouter(LIST_MAPPING, candidates=candidates, loop=100)
+            ok (router.chosen_router().__class__).in_(candidates)
+            ok (router.find) == router.chosen_router().find
+            report = router.report()
+            ok (report).matches(r'^AutoRouter: chose \w+Router')
+            ok (report).matches(r'OptimizedRegexpRouter +: +\d+\.\d+ usec/lookup')
+            ok (report).matches(r'TrieRouter +: +\d+\.\d+ usec/lookup')
+
+        @test("skips candidates which fail to build or return different result.")
+        def _(self):
+            class BrokenRouter(TrieRouter):
+                def find(self, req_path):
+                    return None
+            candidates = (OptimizedRegexpRouter, BrokenRouter)
+            router = AutoRouter(LIST_MAPPING, candidates=candidates, loop=100)
+            ok (router.chosen_router()).is_a(OptimizedRegexpRouter)
+            ok (router.report()).matches(r'BrokenRouter +: skipped: result differs from OptimizedRegexpRouter')
+            #
+            class UnbuildableRouter(TrieRouter):
+                def __init__(self, mapping):
+                    raise RouterError("not buildable.")
+            candidates = (UnbuildableRouter, TrieRouter)
+            router = AutoRouter(LIST_MAPPING, ["/api/v1/books/1.json"], candidates, 100)
+            ok (router.chosen_router()).is_a(TrieRouter)
+            ok (router.report()).matches(r'UnbuildableRouter +: skipped: not buildable\.')
+
+
+class CachedRouter_TestCase(Router_TestBase):
+    ROUTER_CLASS = staticmethod(lambda mapping: CachedRouter(OptimizedRegexpRouter(mapping)))
+
+
+class CachedRouterLRU_TestCase(object):
+
+    def provide_router(self):
+        return CachedRouter(OptimizedRegexpRouter(LIST_MAPPING), 3)
+
+    with subject("#find()"):
+
+        @test("returns fresh param list even when cached.")
+        def _(self, router):
+            t1 = router.find('/api/v1/books/123.json')
+            t1[2].append(999)
+            t2 = router.find('/api/v1/books/123.json')
+            ok (t2[2]) == [123]
+            ok (router.cache_info()["hits"]) == 1
+
+        @test("caches neither static urlpath nor not-found urlpath.")
+        def _(self, router):
+            router.find('/api/v1/books.json')
+            router.find('/api/v1/books/abc.json')
+            ok (router.cache_info()["size"]) == 0
+            ok (router.cache_info()["misses"]) == 2
+
+        @test("evicts least recently used entry.")
+        def _(self, router):
+            for i in range(5):
+                router.find('/api/v1/books/%s.json' % i)
+            router.find('/api/v1/books/2.json')
+            info = router.cache_info()
+            ok (info["size"]) == 3
+            ok (info["evictions"]) == 2
+            ok (info["hits"]) == 1
+
+    with subject("#lookup()"):
+
+        @test("caches result for each request method.")
+        def _(self, router):
+            c = BooksAPI
+            ok (router.lookup('GET', '/api/v1/books/123.json')) == (c, c.do_show, [123])
+            ok (router.lookup('PUT', '/api/v1/books/123.json')) == (c, c.do_update, [123])
+            ok (router.lookup('GET', '/api/v1/books/123.json')) == (c, c.do_show, [123])
+            info = router.cache_info()
+            ok (info["hits"]) == 1
+            ok (info["misses"]) == 2
+
+    with subject("#find_many()"):
+
+        @test("resolves only cache misses by underlying router.")
+        def _(self, router):
+            router.find('/api/v1/books/1.json')
+            paths = ['/api/v1/books/1.json', '/api/v1/books/2.json', '/api/v1/books.json']
+            results = router.find_many(paths)
+            ok (results) == [ router._router.find(p) for p in paths ]
+            info = router.cache_info()
+            ok (info["hits"]) == 1
+            ok (info["misses"]) == 3
+            ok (info["size"]) == 2
+
+class RejectFilterRouter_TestCase(Router_TestBase):
+    ROUTER_CLASS = staticmethod(lambda mapping: RejectFilterRouter(TrieRouter(mapping), mapping))
+
+
+class RejectFilterRouterFilter_TestCase(object):
+
+    def provide_router(self):
+        return RejectFilterRouter(TrieRouter(LIST_MAPPING), LIST_MAPPING)
+
+    with subject("#find()"):
+
+        @test("rejects urlpath by first/second segments and number of segments.")
+        def _(self, router):
+            ok (router.find('/wp-admin/setup.php')) == None
+            ok (router.find('/api/v2/books.json')) == None
+            ok (router.find('/api/v1/books/1/2/3/4/5')) == None
+            ok (router.find('.env')) == None
+            ok (router.filter_info()) == {"rejected": 4, "passed": 0}
+            ok (router.find('/api/v1/books/abc.json')) == None
+            ok (router.find('/api/v1/books/123.json')) != None
+            ok (router.filter_info()) == {"rejected": 4, "passed": 2}
+
+        @test("passes urlpath which may match to 'path' param.")
+        def _(self):
+            class StaticAPI(RequestHandler):
+                with on.path('/{filepath:path}'):
+                    @on('GET')
+                    def do_show(self, filepath):
+                        pass
+            mapping = [('/static', StaticAPI), ('/{lang}/docs', StaticAPI)]
+            router = RejectFilterRouter(TrieRouter(mapping), mapping)
+            ok (router.find('/static/a/b/c.css')) == (StaticAPI, {'GET': StaticAPI.do_show}, ['a/b/c.css'])
+            ok (router.find('/en/docs/x/y')) == (StaticAPI, {'GET': StaticAPI.do_show}, ['en', 'x/y'])
+            ok (router.find('/en/xxx/y')) == None
+            ok (router.find('/')) == None
+            ok (router.filter_info()) == {"rejected": 2, "passed": 2}
+
+    with subject("#find_many()"):
+
+        @test("resolves only urlpaths which passed the filter.")
+        def _(self, router):
+            paths = ['/api/v1/books/123.json', '/.env', '/api/v1/orders/1']
+            ok (router.find_many(paths)) == [ TrieRouter(LIST_MAPPING).find(p) for p in paths ]
+            ok (router.filter_info()) == {"rejected": 1, "passed": 2}
+
+
+class BatchClassifier_TestCase(object):
+
+    def provide_classifier(self):
+        return BatchClassifier(TrieRouter(LIST_MAPPING), LIST_MAPPING, chunk_size=3)
+
+    with subject("#classify()"):
+
+        @test("returns route indices and param columns.")
+        @skip.when(numpy is None, "requires NumPy")
+        def _(self, classifier):
+            paths = ['/api/v1/books/123.json', '/api/v1/books.json', '/api/v1/books/abc.json',
+                     '/api/v1/orders/456', '/api/v1/books/7/comments/abc', '/api/v1/books/8.json']
+            route_ids, columns = classifier.classify(paths)
+            patterns = [ classifier.routes[i][0] if i >= 0 else None for i in route_ids ]
+            ok (patterns) == ['/api/v1/books/{id:int}.json', '/api/v1/books.json', None,
+                              '/api/v1/orders/{id}.*', '/api/v1/books/{book_id:int}/comments/{code}',
+                              '/api/v1/books/{id:int}.json']
+            rows, cols = columns[route_ids[0]]
+            ok (rows.tolist()) == [0, 5]
+            ok (cols[0].tolist()) == [123, 8]
+            rows, cols = columns[route_ids[4]]
+            ok (rows.tolist()) == [4]
+            ok ([ c.tolist() for c in cols ]) == [[7], ['abc']]
+
+        @test("resolves undecidable urlpaths by router.")
+        @skip.when(numpy is None, "requires NumPy")
+        def _(self, classifier):
+            big = '9' * 30
+            paths = ['/api/v1/orders/%s.json' % big, '/api/v1/books/\u00e9.json',
+                     '/api/v1/books/1/comments/' + 'x' * 300]
+            route_ids, columns = classifier.classify(paths)
+            ok (route_ids.tolist()[1]) == -1
+            rows, cols = columns[route_ids[0]]
+            ok (cols[0].tolist()) == [int(big)]
+            rows, cols = columns[route_ids[2]]
+            ok (cols[1].tolist()) == ['x' * 300]
+
+        @test("raises error when NumPy is not installed.")
+        @skip.when(numpy is not None, "NumPy is installed")
+        def _(self):
+            def fn(): BatchClassifier(TrieRouter(LIST_MAPPING), LIST_MAPPING)
+            ok (fn).raises(RouterError, "BatchClassifier: requires NumPy.")
+
+
+class HashedRegexpRouterTable_TestCase(Router_TestBase):
+    ROUTER_CLASS = staticmethod(lambda mapping: HashedRegexpRouter(RouteTable(mapping)))
+
+
+class NestedRegexpRouterTable_TestCase(Router_TestBase):
+    ROUTER_CLASS = staticmethod(lambda mapping: NestedRegexpRouter(RouteTable(mapping)))
+
+
+class RouteTable_TestCase(object):
+
+    ROUTER_CLASSES = RegisterParamType_TestCase.ROUTER_CLASSES + (DFARouter,)
+
+    def provide_table(self):
+        return RouteTable(LIST_MAPPING)
+
+    with subject("#__init__()"):
+
+        @test("traverses mapping only once.")
+        def _(self, table):
+            ok (len(table)) == 8
+            ok ([ t[0] for t in table.routes ]) == [ t[0] for t in Router()._traverse(LIST_MAPPING) ]
+            ok (table.route_count) == 8
+
+    with subject("Router#__init__()"):
+
+        @test("all routers accept RouteTable object instead of mapping.")
+        def _(self, table):
+            paths = ['/', '/api/v1/books/123.json', '/api/v1/books/123/comments/abcd',
+                     '/api/v1/orders/123', '/api/v1/books/abc.json']
+            for router_class in self.ROUTER_CLASSES:
+                expected = [ router_class(LIST_MAPPING).find(p) for p in paths ]
+                ok ([ router_class(table).find(p) for p in paths ]) == expected
+
+        @test("shares compiled regexps between routers.")
+        def _(self, table):
+            r1 = SlicedRegexpRouter(table)
+            r2 = NaiveRegexpRouter(table)
+            ok (len(table._compiles)) > 0
+            rexp1 = r1._compile('/api/v1/books/{id:int}.json')[0]
+            rexp2 = r2._compile('/api/v1/books/{id:int}.json')[0]
+            ok (rexp2).is_(rexp1)
+
+    with subject("#__reduce__()"):
+
+        @test("keeps routes but not caches when pickled.")
+        def _(self, table):
+            NaiveRegexpRouter(table)
+            ok (len(table._compiles)) > 0
+            table2 = pickle.loads(pickle.dumps(table))
+            ok ([ t[0] for t in table2.routes ]) == [ t[0] for t in table.routes ]
+            ok (table2.route_count) == table.route_count
+            ok (table2._compiles) == {}
+            ok (table2.param_types).is_(Router.URLPATH_PARAM_TYPES)
+
+
 if __name__ == '__main__':
     import oktest
     oktest.main()